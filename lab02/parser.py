@@ -1,10 +1,14 @@
+from collections import deque
 from itertools import product
-import heapq
+import json
+import sys
 
 
 # Domain
 
 class Predicate:
+    __slots__ = ('name', 'parameters')
+
     def __init__(self, name, parameters):
         self.name = name.lower()
         self.parameters = parameters
@@ -16,6 +20,8 @@ class Predicate:
 #        self.typeName = typeName
 
 class Action:
+    __slots__ = ('name', 'parameters', 'precondition', 'effect', 'unique')
+
     def __init__(self, name, param, unique=False):
         self.name = name.lower()
         params = dict()
@@ -45,20 +51,59 @@ class Domain:
         else:
             self.actions = actions
 
-    def ground(self, objects):
+    def ground(self, objects, init=None):
         """
-        Ground all action schemas given a dictionary of objects keyed by type
+        Ground all action schemas given a dictionary of objects keyed by type.
+        Parameters only range over objects of their declared type, and bindings
+        that reuse an object for several parameters are dropped unless every
+        repeated-argument fact they mention (e.g. on(D, D)) is in init.
+        When init facts are given, only relaxed-reachable actions are kept
         """
+        init = set() if init is None else set(init)
         grounded_actions = list()
         for action in self.actions:
-            param_lists = [list(objects.keys()) for i in range(len(action.parameters.values()))]
-            param_combos = set()
+            param_lists = [[ob for ob, type_ in objects.items() if type_ == t] for t in action.parameters.values()]
             for params in product(*param_lists):
-                param_combos.add(params)
-                grounded_actions.append(action.ground(*params))
+                a = action.ground(*params)
+                if len(set(params)) < len(params) and not _self_binding_ok(a.precondition + a.effects, init):
+                    continue
+                grounded_actions.append(a)
+        if init:
+            grounded_actions = relaxed_reachable(grounded_actions, init)
         return grounded_actions
 
 
+def _self_binding_ok(facts, init):
+    for fact in facts:
+        args = fact[1:]
+        if len(set(args)) < len(args) and fact not in init:
+            return False
+    return True
+
+
+def relaxed_reachable(grounded_actions, init):
+    """
+    Relaxed reachability fixpoint (deletes ignored): keep the actions whose
+    preconditions can all become true starting from the init facts
+    """
+    reached = set(init)
+    pending = list(grounded_actions)
+    kept = set()
+    changed = True
+    while changed:
+        changed = False
+        rest = list()
+        for a in pending:
+            if all(p in reached for p in a.precondition):
+                kept.add(id(a))
+                reached.update(a.effects)
+                changed = True
+            else:
+                rest.append(a)
+        pending = rest
+    return [a for a in grounded_actions if id(a) in kept]
+
+
 def parse_domain_def(dom_dict):
     name = dom_dict["domain"]
     domain = Domain(name)
@@ -123,53 +168,97 @@ def parse_problem_def(prob_dict):
     return problem
 
 
-def _grounder(arg_names, args):
+def to_facts(predicates):
     """
-    Function for grounding predicates and function symbols
+    Flatten parsed predicates into ground fact tuples such as ('on', 'D', 'C')
     """
-    namemap = dict()
-    for arg_name, arg in zip(arg_names, args):
-        namemap[arg_name] = arg
+    return [(st.name, param[0], param[1]) if isinstance(st.parameters[0], list) else (st.name, param)
+            for st in predicates for param in st.parameters]
 
-    def _ground_by_names(predicate):
-        return (predicate,) + tuple(namemap.get(arg, arg) for arg in predicate)
 
-    return _ground_by_names
+def _ground_facts(schema, binding):
+    """
+    Ground the facts of an action schema, e.g. on(?x, ?y) -> ('on', 'D', 'C')
+    """
+    return tuple((name,) + tuple(binding.get(p, p) for p in params) for name, params in schema.items())
 
 
 class _GroundedAction(object):
     """
-    An action schema that has been grounded with objects
+    An action schema that has been grounded with objects. Preconditions and effects
+    are fact tuples until Parser.compile replaces them by tuples of fact IDs
     """
+    __slots__ = ('name', 'args', 'precondition', 'effects', 'pre_mask', 'del_mask', 'add_mask')
 
     def __init__(self, action, *args):
         self.name = action.name
-        ground = _grounder(tuple(list(action.parameters.keys())), args)  # arg names = xyz
+        self.args = args
+        binding = dict(zip(action.parameters, args))
+        self.precondition = _ground_facts(action.precondition, binding)
+        self.effects = _ground_facts(action.effect, binding)
 
-        # Ground Action Signature
-        self.sig = ground((self.name,) + tuple(action.parameters))
+    def __str__(self):
+        return '(%s %s)' % (self.name, ' '.join(self.args))
 
-        # Ground Preconditions
-        self.precondition = list()
-        self.num_precondition = list()
 
-        for pre in action.precondition.items():
-            gr_precon = ground((pre[0],) + tuple(pre[1]))
-            self.precondition.append((gr_precon[1], gr_precon[2], gr_precon[3]) if len(pre[1]) == 2
-                                     else (gr_precon[1], gr_precon[2]))
+def bits(mask):
+    """
+    Yield the positions of the set bits of mask, lowest first
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
 
-        # Ground Effects
-        self.effects = list()
-        flag1 = False
-        flag2 = False
-        for effect in action.effect.items():
-            gr_action = ground((effect[0],) + tuple(effect[1]))
-            self.effects.append((gr_action[1], gr_action[2], gr_action[3]) if len(effect[1]) == 2
-                                else (gr_action[1], gr_action[2]))
+class SuccessorGenerator(object):
+    """
+    Index of grounded actions keyed on a single precondition fact per action
+    (the least shared one). Only the buckets of facts true in a state are
+    examined, instead of every grounded action
+    """
+
+    def __init__(self, grounded_actions):
+        counts = dict()
+        for action in grounded_actions:
+            for i in bits(action.pre_mask):
+                counts[i] = counts.get(i, 0) + 1
+        self.always = list()
+        self.buckets = dict()
+        for action in grounded_actions:
+            pre = list(bits(action.pre_mask))
+            if not pre:
+                self.always.append(action)
+                continue
+            watch = min(pre, key=lambda i: counts[i])
+            self.buckets.setdefault(watch, list()).append(action)
+
+    def candidates(self, state):
+        for action in self.always:
+            yield action
+        buckets = self.buckets
+        for i in bits(state):
+            if i in buckets:
+                for action in buckets[i]:
+                    yield action
+
+
+class Stats(object):
+    """
+    Node counters collected during a search run
+    """
+
+    def __init__(self):
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.peak_frontier = 0
+
+    def as_dict(self):
+        return dict(vars(self))
 
     def __str__(self):
-        arglist = ', '.join(map(str, self.sig[1:]))
-        return '(%s)' % (arglist)
+        return ', '.join('%s=%s' % (k, v) for k, v in self.as_dict().items())
 
 
 # Parser
@@ -181,103 +270,163 @@ class Parser:
         self.probInput = {}
         self.domain = None
         self.problem = None
+        self.facts = list()
+        self.fact_ids = dict()
+        self.stats = None
+
+    def fact_id(self, fact):
+        """
+        Intern a ground fact, returning its bit position in the state encoding
+        """
+        idx = self.fact_ids.get(fact)
+        if idx is None:
+            idx = len(self.facts)
+            self.fact_ids[fact] = idx
+            self.facts.append(fact)
+        return idx
+
+    def encode_state(self, facts):
+        state = 0
+        for fact in facts:
+            state |= 1 << self.fact_id(fact)
+        return state
+
+    def decode_state(self, state):
+        return [fact for i, fact in enumerate(self.facts) if state >> i & 1]
+
+    def compile(self):
+        """
+        Intern all ground facts and precompile grounded actions into bit masks:
+        an action deletes its preconditions and adds the rest of its effects
+        """
+        self.init_state = self.encode_state(to_facts(self.problem.initial_state))
+        self.goal_state = self.encode_state(to_facts(self.problem.goal))
+        for action in self.grounded_actions:
+            action.pre_mask = self.encode_state(action.precondition)
+            action.del_mask = action.pre_mask
+            action.add_mask = self.encode_state(action.effects) & ~action.pre_mask
+            action.precondition = tuple(bits(action.pre_mask))
+            action.effects = tuple(bits(action.add_mask))
+        self.successor_generator = SuccessorGenerator(self.grounded_actions)
 
     def get_state(self, cur_state, action):
-        new_preds = set(cur_state)
-        new_preds -= set(action.precondition)
-        new_preds |= set(action.effects) - set(action.precondition)
-        return frozenset(new_preds)
+        return (cur_state & ~action.del_mask) | action.add_mask
 
     def gettable(self, cur_state, action):
-        act = set(action.precondition)
-        preds = set(cur_state)
-        for a in act:
-            if a not in preds:
-                return False
-        return True
+        return (cur_state & action.pre_mask) == action.pre_mask
 
     def parse_domain(self):
-        f = open(self.domFile)
-        self.domInput = json.load(f)
+        with open(self.domFile, 'rb') as f:
+            self.domInput = json.loads(f.read())
 
         domain = parse_domain_def(self.domInput)
         self.domain = domain
 
     def parse_problem(self):
-        f = open(self.probFile)
-        self.probInput = json.load(f)
+        with open(self.probFile, 'rb') as f:
+            self.probInput = json.loads(f.read())
 
         problem = parse_problem_def(self.probInput)
         self.problem = problem
-        self.grounded_actions = self.domain.ground(self.problem.objects)
+        self.grounded_actions = self.domain.ground(self.problem.objects, to_facts(self.problem.initial_state))
+        self.compile()
 
-    def bfs_planner(self, state=None, visited=None, queue=None):
+    def bfs_planner(self, state=None, visited=None, queue=None, reporter=None):
+        """
+        Breadth-first search to the goal. Returns the plan as a list of grounded
+        actions, None if there is no solution. Nothing is printed unless a reporter
+        (e.g. ConsoleReporter) is given, it receives 'start' and 'done' event dicts
+        """
         if state == None:
-            state = self.problem.initial_state
-        if visited == None:
-            visited = list()
+            state = self.init_state
         if queue == None:
-            queue = list()
+            queue = deque()
 
-        if not isinstance(state, frozenset):
-            state = frozenset((st.name, param[0], param[1]) if isinstance(st.parameters[0], list) else (st.name, param)
-                              for st in state for param in st.parameters)
-        if not isinstance(self.problem.goal, frozenset):
-            goal_state = set((st.name, param[0], param[1]) if isinstance(st.parameters[0], list) else (st.name, param)
-                             for st in self.problem.goal for param in st.parameters)
-        print("Init state:\n", list(state))
-        print("Goal state:\n", list(goal_state))
+        if not isinstance(state, int):
+            state = self.encode_state(to_facts(state))
+        goal_state = self.goal_state
+        if reporter is not None:
+            reporter({'event': 'start', 'init': state, 'goal': goal_state})
 
         queue.append(state)
         plan = dict()
         plan[state] = None
         """
-        create a plan by dict (new_state: cur state), go back to create a list
+        create a plan by dict (new_state: (cur_state, action)), go back to create a list;
+        the plan keys are every generated state, so they double as the closed set
         """
-        while queue:
-            cur_state = queue.pop(0)
+        if visited != None:
+            for st in visited:
+                plan.setdefault(st, None)
+        self.stats = Stats()
+        self.stats.peak_frontier = len(queue)
+        # the goal may name only some facts, and it is tested when a state is
+        # generated, which saves expanding the whole last BFS layer
+        goal = state if state & goal_state == goal_state else None
+        while queue and goal is None:
+            cur_state = queue.popleft()
+            self.stats.expanded += 1
+            for action in self.successor_generator.candidates(cur_state):
+                if self.gettable(cur_state, action):
+                    act = self.get_state(cur_state, action)
+                    self.stats.generated += 1
+                    if act in plan:
+                        self.stats.duplicates += 1
+                        continue
+                    queue.append(act)
+                    plan[act] = (cur_state, action)
+                    if act & goal_state == goal_state:
+                        goal = act
+                        break
+            self.stats.peak_frontier = max(self.stats.peak_frontier, len(queue))
+
+        if goal is not None:
+            cur_state = goal
+            full_path = list([cur_state])
+            actions = list()
+            while plan[cur_state] != None:
+                cur_state, action = plan[cur_state]
+                full_path.append(cur_state)
+                actions.append(action)
+            full_path = list(reversed(full_path))
+            actions = list(reversed(actions))
+            if reporter is not None:
+                reporter({'event': 'done', 'plan': actions, 'states': full_path, 'stats': self.stats})
+            return actions
+        if reporter is not None:
+            reporter({'event': 'done', 'plan': None, 'states': None, 'stats': self.stats})
+        return None
+
+
+class ConsoleReporter(object):
+    """
+    Prints the events of bfs_planner: init and goal states, then the plan states
+    """
 
-            if equal(cur_state, goal_state):
+    def __init__(self, parser):
+        self.parser = parser
+
+    def __call__(self, event):
+        if event['event'] == 'start':
+            print("Init state:\n", self.parser.decode_state(event['init']))
+            print("Goal state:\n", self.parser.decode_state(event['goal']))
+        elif event['event'] == 'done':
+            if event['plan'] is None:
+                print("no solution")
+            else:
                 print("Plan:")
-                path = plan[cur_state]
-                full_path = list([goal_state])
-                while path != None:
-                    full_path.append(list(path))
-                    path = plan[path]
-                full_path = list(reversed(full_path))
-                for i in full_path:
-                    print(i)
-                return 0
-
-            if cur_state not in visited:
-                visited.append(cur_state)
-                actions = set(self.get_state(cur_state, action) for action in self.grounded_actions
-                              if self.gettable(cur_state, action))
-                for act in actions:
-                    if act not in visited:
-                        queue.append(act)
-                        plan[act] = cur_state
-        return print("no solution")
-
-
-def equal(st1, st2):
-    if len(st1) != len(st2):
-        return False
-    for pred in st1:
-        if pred not in st2:
-            return False
-    return True
+                for st in event['states']:
+                    print(self.parser.decode_state(st))
+            print(event['stats'])
 
 
 if __name__ == "__main__":
-    import json
-
-    json_dom = 'domain.json'
-    json_prob = 'task01.json'
+    json_dom = sys.argv[1] if len(sys.argv) > 1 else 'domain.json'
+    json_prob = sys.argv[2] if len(sys.argv) > 2 else 'task01.json'
 
     parse_dom = Parser(json_dom, json_prob)
     parse_dom.parse_domain()
     parse_dom.parse_problem()
-    parse_dom.bfs_planner()
+    parse_dom.bfs_planner(reporter=ConsoleReporter(parse_dom))
 
 # [i.__str__() for i in parse_dom.grounded_actions]
\ No newline at end of file
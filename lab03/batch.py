@@ -0,0 +1,168 @@
+import argparse
+import glob
+import importlib
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import plan_store
+
+
+# Batch solver: the domain is parsed once per worker process, then problem
+# files are spread across a process pool. Results are streamed back as they
+# finish and collected into one result file.
+#
+#   python batch.py tasks/*.json --domain domain.json --timeout 30 --memory-mb 2048 --out results.json
+#   python batch.py tasks/*.json --task-cache .tasks   # skip grounding on repeated problems
+
+PLANNERS = ['astar', 'bfs', 'gbfs', 'idastar', 'smastar']
+
+_worker = dict()
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise TaskTimeout()
+
+
+def _init_worker(parser_module, dom_file, dom_input, memory_mb, cache_dir=None):
+    """
+    Pool initializer: parse the domain once and apply the memory cap to this process
+    """
+    if memory_mb:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    module = importlib.import_module(parser_module)
+    _worker['module'] = module
+    _worker['dom_file'] = dom_file
+    _worker['dom_input'] = dom_input
+    _worker['domain'] = module.parse_domain_def(dom_input)
+    _worker['task_cache'] = cache_dir
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def run_planner(parser, planner='astar', heuristic='goal_count', max_nodes=100000):
+    """
+    Run one of PLANNERS on a parsed problem
+    """
+    if planner == 'bfs':
+        return parser.bfs_planner()
+    elif planner == 'gbfs':
+        return parser.gbfs_planner(heuristic=heuristic)
+    elif planner == 'idastar':
+        return parser.idastar_planner(heuristic=heuristic)
+    elif planner == 'smastar':
+        return parser.smastar_planner(max_nodes, heuristic=heuristic)
+    return parser.astar_planner(heuristic=heuristic)
+
+
+def solve_task(prob_file, planner='astar', heuristic='goal_count', timeout=None, max_nodes=100000, profile=False):
+    """
+    Solve one problem file in a worker against the shared parsed domain
+    """
+    parser = _worker['module'].Parser(_worker['dom_file'], prob_file)
+    parser.domInput = _worker['dom_input']
+    parser.domain = _worker['domain']
+    parser.task_cache = _worker['task_cache']
+    result = {'problem': prob_file}
+    result.update(solve_parser(parser, planner, heuristic, timeout, max_nodes, profile))
+    return result
+
+
+def solve_parser(parser, planner='astar', heuristic='goal_count', timeout=None, max_nodes=100000, profile=False):
+    """
+    Parse the problem of a parser whose domain is set and plan for it. Returns the
+    result dict; timeout needs the SIGALRM handler of _init_worker
+    """
+    result = {'planner': planner}
+    start = time.perf_counter()
+    if profile:
+        parser.enable_profiling()
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        parser.parse_problem()
+        plan = run_planner(parser, planner, heuristic, max_nodes)
+        result['status'] = 'solved' if plan is not None else 'unsolvable'
+        result['plan'] = None if plan is None else [plan_store.action_key(a) for a in plan]
+        result['plan_length'] = None if plan is None else len(plan)
+    except TaskTimeout:
+        result['status'] = 'timeout'
+    except MemoryError:
+        result['status'] = 'memory'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    result['time_s'] = round(time.perf_counter() - start, 6)
+    result['stats'] = parser.stats.as_dict() if parser.stats is not None else None
+    if profile:
+        result['profile'] = parser.profile.as_dict()
+    return result
+
+
+def solve_batch(prob_files, dom_file='domain.json', parser_module='parser_pickle', planner='astar',
+                heuristic='goal_count', timeout=None, memory_mb=None, workers=None, cache_dir=None, max_nodes=100000,
+                profile=False):
+    """
+    Yield one result dict per problem file, in completion order
+    """
+    with open(dom_file) as f:
+        dom_input = json.load(f)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(parser_module, dom_file, dom_input, memory_mb, cache_dir)) as pool:
+        futures = dict((pool.submit(solve_task, prob_file, planner, heuristic, timeout, max_nodes, profile), prob_file)
+                       for prob_file in prob_files)
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                yield {'problem': futures[future], 'planner': planner, 'status': 'crashed'}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Solve many problem files against one domain in parallel")
+    ap.add_argument('problems', nargs='+', help="problem JSON files or glob patterns")
+    ap.add_argument('--domain', default='domain.json')
+    ap.add_argument('--parser', default='parser_pickle', choices=['parser_pickle', 'parser_agents'])
+    ap.add_argument('--planner', default='astar', choices=PLANNERS)
+    ap.add_argument('--heuristic', default='goal_count')
+    ap.add_argument('--timeout', type=float, help="seconds per task")
+    ap.add_argument('--memory-mb', type=int, help="address space cap per worker process")
+    ap.add_argument('--max-nodes', type=int, default=100000, help="node limit of the smastar planner")
+    ap.add_argument('--workers', type=int, help="worker processes (all cores by default)")
+    ap.add_argument('--task-cache', metavar='DIR', help="reuse compiled tasks stored in DIR")
+    ap.add_argument('--profile', action='store_true', help="add phase times and counters to every result")
+    ap.add_argument('--out', default='results.json')
+    args = ap.parse_args(argv)
+
+    prob_files = list()
+    for pattern in args.problems:
+        prob_files.extend(sorted(glob.glob(pattern)) or [pattern])
+    order = dict((p, i) for i, p in enumerate(prob_files))
+
+    results = list()
+    for result in solve_batch(prob_files, args.domain, args.parser, args.planner, args.heuristic, args.timeout,
+                              args.memory_mb, args.workers, args.task_cache, args.max_nodes,
+                              args.profile):
+        print(json.dumps(dict((k, v) for k, v in result.items() if k not in ('plan', 'profile'))), flush=True)
+        results.append(result)
+    results.sort(key=lambda r: order.get(r['problem'], len(order)))
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
+    solved = sum(1 for r in results if r['status'] == 'solved')
+    print("%d/%d solved, results in %s" % (solved, len(results), os.path.abspath(args.out)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import csv
+import importlib
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+
+# Benchmark harness: generates random BLOCKS problems in the task01.json format
+# (weighted blocks for the agents of domain.json), runs them through the
+# planners and writes a JSON/CSV report that can be compared between commits.
+#
+#   python benchmark.py --sizes 3,4,5,6 --seeds 3 --out bench.json
+#   python benchmark.py --sizes 3,4,5,6 --seeds 3 --out new.json --compare bench.json
+#   python benchmark.py --sizes 8,16,32 --grounding-memory
+#   python benchmark.py --sizes 8,16,32 --planners astar,gbfs --lazy --compare bench.json
+#   python benchmark.py --planners bfs --backend numpy --compare bench.json   # needs numpy
+#   python benchmark.py --planners bfs,parallel --sizes 7,8 --workers 4 --no-memory
+
+PLANNERS = ('bfs', 'bidir', 'astar', 'gbfs', 'preplan', 'idastar', 'smastar')
+# planners that are only run when asked for with --planners
+EXTRA_PLANNERS = ('parallel',)
+FIELDS = ['commit', 'problem', 'blocks', 'seed', 'parser', 'lazy', 'backend', 'workers', 'planner', 'heuristic',
+          'solved', 'plan_length', 'parse_s', 'time_s', 'peak_kb', 'grounded_actions', 'expanded', 'generated',
+          'duplicates', 'peak_frontier']
+
+
+def block_names(n):
+    if n <= 26:
+        return [chr(ord('A') + i) for i in range(n)]
+    return ['B%d' % i for i in range(n)]
+
+
+def random_towers(blocks, rng):
+    """
+    Random BLOCKS configuration as a list of towers, bottom block first
+    """
+    blocks = list(blocks)
+    rng.shuffle(blocks)
+    towers = list()
+    while blocks:
+        k = rng.randint(1, len(blocks))
+        towers.append(blocks[:k])
+        blocks = blocks[k:]
+    return towers
+
+
+def towers_facts(towers):
+    facts = {"CLEAR": [t[-1] for t in towers], "ONTABLE": [t[0] for t in towers]}
+    on = [[t[i + 1], t[i]] for t in towers for i in range(len(t) - 1)]
+    if on:
+        facts["ON"] = on
+    return facts
+
+
+def random_blocks_problem(n, seed, max_weight=60):
+    """
+    A random n-block problem whose goal is a full configuration, so that the
+    bidirectional planner stays optimal. Weights stay at or below max_weight so
+    that every block fits some agent of domain.json
+    """
+    rng = random.Random(seed)
+    blocks = block_names(n)
+    init = random_towers(blocks, rng)
+    goal = random_towers(blocks, rng)
+    while sorted(goal) == sorted(init) and n > 1:
+        goal = random_towers(blocks, rng)
+    return {
+        "name": "BLOCKS-%d-%d" % (n, seed),
+        "objects": {"block": dict((b, [rng.randint(1, max_weight)]) for b in blocks)},
+        "init": towers_facts(init),
+        "goal": towers_facts(goal),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_planner(parser, planner, heuristic, backend='python', workers=None):
+    if planner == 'bfs':
+        return parser.bfs_planner(backend=backend)
+    if planner == 'astar':
+        return parser.astar_planner(heuristic=heuristic)
+    if planner == 'gbfs':
+        return parser.gbfs_planner(heuristic=heuristic)
+    if planner == 'bidir':
+        return parser.bidirectional_planner()
+    if planner == 'preplan':
+        return parser.preplan()
+    if planner == 'idastar':
+        return parser.idastar_planner(heuristic=heuristic)
+    if planner == 'smastar':
+        return parser.smastar_planner(heuristic=heuristic)
+    if planner == 'parallel':
+        return parser.parallel_planner(workers=workers)
+    raise ValueError("unknown planner %r" % planner)
+
+
+def measure(module, dom_file, prob_file, planner, heuristic, plan_db, memory=True, lazy=False, backend='python',
+            workers=None):
+    """
+    Parse, ground and solve one problem, returning a report row. With memory=True
+    the peak is taken from tracemalloc, which also slows the run down and does
+    not see the worker processes of the parallel planner
+    """
+    parser = module.Parser(dom_file, prob_file, lazy=lazy)
+    parser.plan_db = plan_db
+    parser.parse_domain()
+    start = time.perf_counter()
+    parser.parse_problem()
+    parse_s = time.perf_counter() - start
+    if planner == 'preplan':
+        # fill the store first, only the cached lookup is measured
+        parser.astar_planner(save=True, heuristic=heuristic)
+        parser.stats = None
+
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    plan = run_planner(parser, planner, heuristic, backend, workers)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    row = {
+        'planner': planner,
+        'heuristic': heuristic if planner in ('astar', 'gbfs', 'preplan', 'idastar', 'smastar') else '',
+        'solved': plan is not None,
+        'plan_length': len(plan) if plan is not None else None,
+        'lazy': lazy,
+        'backend': backend if planner == 'bfs' else '',
+        'workers': (workers or os.cpu_count()) if planner == 'parallel' else '',
+        'parse_s': round(parse_s, 6),
+        'time_s': round(elapsed, 6),
+        'peak_kb': peak,
+        'grounded_actions': len(parser.grounded_actions),
+    }
+    stats = parser.stats.as_dict() if parser.stats is not None else dict()
+    for field in ('expanded', 'generated', 'duplicates', 'peak_frontier'):
+        row[field] = stats.get(field)
+    return row
+
+
+def grounding_memory(module, dom_file, prob_file):
+    """
+    Memory retained by the grounded, compiled task of one problem, from tracemalloc,
+    also given per 1000 grounded actions
+    """
+    parser = module.Parser(dom_file, prob_file)
+    parser.parse_domain()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parser.parse_problem()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    n = len(parser.grounded_actions)
+    return {'grounded_actions': n, 'retained_kb': retained // 1024,
+            'kb_per_1k_actions': round(retained / 1024 / n * 1000, 1) if n else None}
+
+
+def run_suite(sizes, seeds, planners, heuristic='goal_count', parser_module='parser_pickle', dom_file='domain.json',
+              max_weight=60, memory=True, workdir=None, lazy=False, backend='python', workers=None):
+    module = importlib.import_module(parser_module)
+    commit = git_commit()
+    rows = list()
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = workdir or tmp
+        for n in sizes:
+            for seed in range(seeds):
+                problem = random_blocks_problem(n, seed, max_weight)
+                prob_file = os.path.join(workdir, problem["name"] + '.json')
+                with open(prob_file, 'w') as f:
+                    json.dump(problem, f)
+                for planner in planners:
+                    plan_db = os.path.join(tmp, 'plan.db')
+                    row = measure(module, dom_file, prob_file, planner, heuristic, plan_db, memory, lazy, backend,
+                                  workers)
+                    row.update({'commit': commit, 'problem': problem["name"], 'blocks': n, 'seed': seed,
+                                'parser': parser_module})
+                    rows.append(row)
+                    print(', '.join('%s=%s' % (k, row[k]) for k in ('problem', 'planner', 'solved', 'plan_length',
+                                                                     'parse_s', 'time_s', 'peak_kb', 'expanded')))
+    return rows
+
+
+def write_report(rows, out):
+    with open(out, 'w') as f:
+        json.dump(rows, f, indent=1)
+    with open(os.path.splitext(out)[0] + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict((k, row.get(k)) for k in FIELDS))
+
+
+def compare(rows, baseline_file):
+    """
+    Print time and expansion ratios (new / baseline) for rows present in both reports
+    """
+    with open(baseline_file) as f:
+        base = dict(((r['problem'], r['planner'], r['heuristic']), r) for r in json.load(f))
+    print("problem, planner, parse time ratio, time ratio, expanded ratio, plan length (new/base)")
+    for row in rows:
+        old = base.get((row['problem'], row['planner'], row['heuristic']))
+        if old is None:
+            continue
+        parse_ratio = row['parse_s'] / old['parse_s'] if old.get('parse_s') else None
+        time_ratio = row['time_s'] / old['time_s'] if old['time_s'] else None
+        exp_ratio = row['expanded'] / old['expanded'] if row['expanded'] and old['expanded'] else None
+        print(row['problem'], row['planner'],
+              '%.2f' % parse_ratio if parse_ratio is not None else '-',
+              '%.2f' % time_ratio if time_ratio is not None else '-',
+              '%.2f' % exp_ratio if exp_ratio is not None else '-',
+              '%s/%s' % (row['plan_length'], old['plan_length']))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the lab03 planners on random BLOCKS problems")
+    ap.add_argument('--sizes', default='3,4,5,6', help="comma separated block counts")
+    ap.add_argument('--seeds', type=int, default=3, help="problems per size")
+    ap.add_argument('--planners', default=','.join(PLANNERS),
+                    help="comma separated, from %s" % ', '.join(PLANNERS + EXTRA_PLANNERS))
+    ap.add_argument('--heuristic', default='goal_count')
+    ap.add_argument('--parser', default='parser_pickle', choices=['parser_pickle', 'parser_agents'])
+    ap.add_argument('--domain', default='domain.json')
+    ap.add_argument('--max-weight', type=int, default=60)
+    ap.add_argument('--no-memory', action='store_true', help="skip tracemalloc for undisturbed timings")
+    ap.add_argument('--keep-problems', metavar='DIR', help="write the generated problems to DIR")
+    ap.add_argument('--out', default='bench.json', help="JSON report, a CSV is written next to it")
+    ap.add_argument('--compare', metavar='BASELINE', help="JSON report of an earlier run")
+    ap.add_argument('--lazy', action='store_true', help="ground actions on demand during search")
+    ap.add_argument('--backend', default='python', choices=['python', 'numpy'], help="expansion backend of bfs")
+    ap.add_argument('--workers', type=int, help="worker processes of the parallel planner (all cores by default)")
+    ap.add_argument('--grounding-memory', action='store_true',
+                    help="only report the memory held by the grounded tasks")
+    args = ap.parse_args(argv)
+
+    if args.grounding_memory:
+        module = importlib.import_module(args.parser)
+        with tempfile.TemporaryDirectory() as tmp:
+            for n in [int(n) for n in args.sizes.split(',')]:
+                problem = random_blocks_problem(n, 0, args.max_weight)
+                prob_file = os.path.join(tmp, problem["name"] + '.json')
+                with open(prob_file, 'w') as f:
+                    json.dump(problem, f)
+                row = grounding_memory(module, args.domain, prob_file)
+                print("%s: %d grounded actions, %d KB, %.1f KB per 1k actions" % (
+                    problem["name"], row['grounded_actions'], row['retained_kb'], row['kb_per_1k_actions']))
+        return
+
+    if args.keep_problems:
+        os.makedirs(args.keep_problems, exist_ok=True)
+    planners = args.planners.split(',')
+    if not hasattr(importlib.import_module(args.parser).Parser, 'preplan'):
+        # only parser_pickle keeps a plan store
+        planners = [p for p in planners if p != 'preplan']
+    if args.lazy:
+        if args.heuristic != 'goal_count':
+            ap.error("--lazy only supports --heuristic goal_count, the relaxed heuristics need every grounded action")
+        if args.backend != 'python':
+            ap.error("--lazy needs --backend python, the numpy backend needs every grounded action")
+        # regression and the parallel workers need every grounded action
+        planners = [p for p in planners if p not in ('bidir', 'parallel')]
+    rows = run_suite([int(n) for n in args.sizes.split(',')], args.seeds, planners, args.heuristic,
+                     args.parser, args.domain, args.max_weight, not args.no_memory, args.keep_problems, args.lazy,
+                     args.backend, args.workers)
+    write_report(rows, args.out)
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import multiprocessing as mp
+import os
+import traceback
+
+from search import Stats
+from search import _identity
+from search import successors
+
+
+# Hash-distributed parallel breadth-first search, in the style of HDA*.
+# Every worker process owns the states whose key hashes to it and keeps their
+# parents and its own slice of the frontier. Generated states are batched per
+# owner and exchanged through queues. Layers are expanded in lockstep, so the
+# first layer that contains a goal state gives the same plan length as serial BFS.
+#
+# The queues are multiprocessing.Queue objects carrying one pickled batch per
+# owner and layer, not lock-free shared-memory ring buffers: states are Python
+# ints of any width and the parent maps are ordinary dicts local to each worker,
+# so there is no fixed-size record to place in shared memory. Batching keeps the
+# pickling to one message per worker pair and layer, and the per-layer barrier
+# replaces the asynchronous termination detection of HDA*. The exchange only
+# pays off with several cores and large layers; on a single core the workers
+# just add pickling and process overhead to serial BFS. Compare with
+#   python benchmark.py --planners bfs,parallel --sizes 7,8 --workers 4 --no-memory
+
+def _worker(wid, n, parser, goal, control, inboxes, results):
+    try:
+        key = parser.state_key or _identity
+        parents = dict()
+        frontier = list()
+        stats = Stats()
+        while True:
+            cmd = control.get()
+            if cmd[0] == 'seed':
+                parents[key(cmd[1])] = None
+                frontier = [cmd[1]]
+            elif cmd[0] == 'expand':
+                batches = [list() for _ in range(n)]
+                for state in frontier:
+                    stats.expanded += 1
+                    for action, new_state in successors(parser, state, stats):
+                        stats.generated += 1
+                        batches[hash(key(new_state)) % n].append((new_state, state, action.index))
+                for j in range(n):
+                    if j != wid:
+                        inboxes[j].put(batches[j])
+                incoming = [batches[wid]] + [inboxes[wid].get() for _ in range(n - 1)]
+
+                frontier = list()
+                found = None
+                for batch in incoming:
+                    for new_state, state, i in batch:
+                        new_key = key(new_state)
+                        if new_key in parents:
+                            stats.duplicates += 1
+                            continue
+                        parents[new_key] = (state, i)
+                        frontier.append(new_state)
+                        if found is None and new_state & goal == goal:
+                            found = new_state
+                results.put(('layer', wid, found, len(frontier)))
+            elif cmd[0] == 'parent':
+                results.put(('parent', wid, parents[key(cmd[1])]))
+            elif cmd[0] == 'stop':
+                results.put(('stats', wid, stats.as_dict()))
+                return
+    except Exception:
+        results.put(('error', wid, traceback.format_exc()))
+
+
+def _get(results, kind):
+    msg = results.get()
+    if msg[0] == 'error':
+        raise RuntimeError("hda worker %d failed:\n%s" % (msg[1], msg[2]))
+    assert msg[0] == kind, msg
+    return msg
+
+
+def hda_bfs(parser, start, goal, workers=None, stats=None):
+    """
+    Parallel breadth-first search over worker processes partitioned by state hash.
+    Returns the plan as a list of grounded actions or None
+    """
+    if stats is None:
+        stats = Stats()
+    if start & goal == goal:
+        return []
+    n = workers or os.cpu_count() or 1
+    ctx = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else mp.get_context()
+    key = parser.state_key or _identity
+
+    def owner(state):
+        return hash(key(state)) % n
+
+    controls = [ctx.Queue() for _ in range(n)]
+    inboxes = [ctx.Queue() for _ in range(n)]
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(i, n, parser, goal, controls[i], inboxes, results), daemon=True)
+             for i in range(n)]
+    for p in procs:
+        p.start()
+
+    plan = None
+    try:
+        controls[owner(start)].put(('seed', start))
+        total = 1
+        found = None
+        while total and found is None:
+            for c in controls:
+                c.put(('expand',))
+            total = 0
+            for _ in range(n):
+                msg = _get(results, 'layer')
+                total += msg[3]
+                if found is None and msg[2] is not None:
+                    found = msg[2]
+            stats.peak_frontier = max(stats.peak_frontier, total)
+
+        if found is not None:
+            plan = list()
+            state = found
+            while True:
+                controls[owner(state)].put(('parent', state))
+                parent = _get(results, 'parent')[2]
+                if parent is None:
+                    break
+                state, i = parent
+                plan.append(parser.grounded_actions[i])
+            plan.reverse()
+
+        for c in controls:
+            c.put(('stop',))
+        for _ in range(n):
+            worker_stats = _get(results, 'stats')[2]
+            stats.expanded += worker_stats['expanded']
+            stats.generated += worker_stats['generated']
+            stats.duplicates += worker_stats['duplicates']
+    finally:
+        for p in procs:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+    return plan
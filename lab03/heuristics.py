@@ -0,0 +1,243 @@
+import heapq
+
+from search import bits
+from search import goal_distance
+
+
+# Domain-independent heuristics over the grounded task built by Parser.compile.
+# All of them work on the delete relaxation: an action needs its precondition
+# facts and makes its add facts true. Each action keeps a counter of
+# preconditions not reached yet, so an evaluation only touches the actions
+# whose preconditions get reached instead of rescanning the whole list. The
+# counters are allocated once per heuristic and stamped with the evaluation
+# that last set them, so an evaluation never resets all of them.
+# An evaluation returns INF when the goal is unreachable from the state.
+
+INF = float('inf')
+
+
+class RelaxedTask(object):
+    """
+    Precondition/add lists of the grounded actions indexed by fact id
+    """
+
+    def __init__(self, parser):
+        if getattr(parser, 'lazy', False):
+            raise ValueError("relaxed heuristics need every grounded action, use goal_count with lazy grounding")
+        self.actions = list(parser.grounded_actions)
+        self.pre = [list(bits(a.pre_mask)) for a in self.actions]
+        self.add = [list(bits(a.add_mask)) for a in self.actions]
+        self.precondition_of = dict()
+        for i, pre in enumerate(self.pre):
+            for f in pre:
+                self.precondition_of.setdefault(f, list()).append(i)
+        self.no_pre = [i for i, pre in enumerate(self.pre) if not pre]
+        self.goal = list(bits(parser.goal_state))
+        self.sizes = [len(pre) for pre in self.pre]
+
+
+class GoalCount(object):
+    """
+    Number of goal facts missing from the state
+    """
+
+    def __init__(self, parser):
+        self.goal = parser.goal_state
+
+    def __call__(self, state):
+        return goal_distance(state, self.goal)
+
+
+class HAdd(object):
+    """
+    h_add: sum of the relaxed costs of the goal facts, where the cost of an action
+    is 1 plus the sum of its precondition costs. HMax combines with max instead
+    """
+
+    def __init__(self, parser):
+        self.task = RelaxedTask(parser)
+        self.counter = [0] * len(self.task.pre)
+        self.acc = [0] * len(self.task.pre)
+        self.stamp = [0] * len(self.task.pre)
+        self.evaluations = 0
+
+    def combine(self, a, b):
+        return a + b
+
+    def explore(self, state):
+        """
+        Generalized Dijkstra over facts. Returns (cost, supporter) dicts keyed by
+        fact id, stopping once every goal fact has its final cost
+        """
+        task = self.task
+        combine = self.combine
+        sizes = task.sizes
+        counter = self.counter
+        acc = self.acc
+        stamp = self.stamp
+        self.evaluations += 1
+        now = self.evaluations
+        cost = dict()
+        supporter = dict()
+        heap = list()
+        for f in bits(state):
+            cost[f] = 0
+            heap.append((0, f))
+        for i in task.no_pre:
+            for f in task.add[i]:
+                if 1 < cost.get(f, INF):
+                    cost[f] = 1
+                    supporter[f] = i
+                    heap.append((1, f))
+        heapq.heapify(heap)
+
+        goals_left = set(task.goal)
+        done = set()
+        while heap and goals_left:
+            c, f = heapq.heappop(heap)
+            if f in done:
+                continue
+            done.add(f)
+            goals_left.discard(f)
+            for i in task.precondition_of.get(f, ()):
+                if stamp[i] != now:
+                    # first precondition of i reached in this evaluation
+                    stamp[i] = now
+                    counter[i] = sizes[i] - 1
+                    acc[i] = c
+                else:
+                    counter[i] -= 1
+                    acc[i] = combine(acc[i], c)
+                if counter[i] == 0:
+                    ac = acc[i] + 1
+                    for g in task.add[i]:
+                        if ac < cost.get(g, INF):
+                            cost[g] = ac
+                            supporter[g] = i
+                            heapq.heappush(heap, (ac, g))
+        return cost, supporter
+
+    def __call__(self, state):
+        cost, supporter = self.explore(state)
+        h = 0
+        for g in self.task.goal:
+            h = self.combine(h, cost.get(g, INF))
+        return h
+
+
+class HMax(HAdd):
+    """
+    h_max: the most expensive goal fact, where the cost of an action is 1 plus the
+    cost of its most expensive precondition
+    """
+
+    def combine(self, a, b):
+        return a if a > b else b
+
+
+class HFF(HAdd):
+    """
+    h_FF: size of a relaxed plan extracted from the h_add best supporters
+    """
+
+    def __call__(self, state):
+        cost, supporter = self.explore(state)
+        plan = set()
+        stack = [g for g in self.task.goal if not state >> g & 1]
+        seen = set(stack)
+        while stack:
+            f = stack.pop()
+            if f not in supporter:
+                return INF
+            i = supporter[f]
+            if i in plan:
+                continue
+            plan.add(i)
+            for p in self.task.pre[i]:
+                if p not in seen and not state >> p & 1:
+                    seen.add(p)
+                    stack.append(p)
+        return len(plan)
+
+
+class LandmarkCount(object):
+    """
+    Number of fact landmarks of the state that are not true in it. Landmarks are
+    found by propagating, for every fact, the set of facts any relaxed path to it
+    must achieve (intersection over achievers, union over preconditions), with the
+    sets held as bitsets. The landmarks of the goal facts are found once, from the
+    initial state; a state counts those of its unreached goal facts
+    """
+
+    def __init__(self, parser):
+        self.task = RelaxedTask(parser)
+        lm = self.landmarks(parser.init_state)
+        if all(g in lm for g in self.task.goal):
+            self.goal_landmarks = [(1 << g, lm[g]) for g in self.task.goal]
+        else:
+            self.goal_landmarks = None
+
+    def landmarks(self, state):
+        task = self.task
+        counter = [len(pre) for pre in task.pre]
+        lm = dict()
+        queue = list(task.no_pre)
+        queued = set(queue)
+        for f in bits(state):
+            lm[f] = 1 << f
+            for i in task.precondition_of.get(f, ()):
+                counter[i] -= 1
+                if counter[i] == 0 and i not in queued:
+                    queue.append(i)
+                    queued.add(i)
+
+        while queue:
+            i = queue.pop()
+            queued.discard(i)
+            la = 0
+            for p in task.pre[i]:
+                la |= lm[p]
+            for f in task.add[i]:
+                new = la | 1 << f
+                old = lm.get(f)
+                if old is None:
+                    lm[f] = new
+                    for j in task.precondition_of.get(f, ()):
+                        counter[j] -= 1
+                        if counter[j] == 0 and j not in queued:
+                            queue.append(j)
+                            queued.add(j)
+                elif old & new != old:
+                    lm[f] = old & new
+                    for j in task.precondition_of.get(f, ()):
+                        if counter[j] == 0 and j not in queued:
+                            queue.append(j)
+                            queued.add(j)
+        return lm
+
+    def __call__(self, state):
+        if self.goal_landmarks is None:
+            return INF
+        needed = 0
+        for goal, landmarks in self.goal_landmarks:
+            if not state & goal:
+                needed |= landmarks
+        return bin(needed & ~state).count("1")
+
+
+HEURISTICS = {
+    'goal_count': GoalCount,
+    'h_add': HAdd,
+    'h_max': HMax,
+    'h_ff': HFF,
+    'lm_count': LandmarkCount,
+}
+
+
+def make_heuristic(name, parser):
+    if name not in HEURISTICS:
+        raise ValueError("unknown heuristic %r, expected one of %s" % (name, ', '.join(sorted(HEURISTICS))))
+    h = HEURISTICS[name](parser)
+    if getattr(parser, 'profile', None) is not None:
+        h = parser.profile.counted('heuristic', h)
+    return h
@@ -0,0 +1,163 @@
+from itertools import product
+
+from search import bits
+
+
+# Lazy grounding for the lab03 parsers, Parser(..., lazy=True). Instead of
+# grounding every schema for every agent and tuple of objects up front, the
+# successor generator joins the preconditions of each schema against the facts
+# true in a state and grounds only the bindings it finds. Grounded actions are
+# memoized per binding, compiled to masks on first use and appended to
+# parser.grounded_actions (so action.index works as with eager grounding);
+# facts are interned as they first show up.
+#
+# The relaxed heuristics, symmetry merging, regression, parallel BFS and the
+# task cache need the whole action set and are not available in this mode.
+
+class _Schema(object):
+    """
+    Join plan of an action schema: the preconditions that ground into facts, in an
+    order where each one shares variables with the earlier ones where possible,
+    and the parameters that no precondition binds
+    """
+
+    def __init__(self, action):
+        self.action = action
+        self.params = list(action.parameters)
+        pending = [(name, list(args)) for name, args in action.precondition.items()
+                   if args and args[0] in action.parameters]
+        self.joins = list()
+        bound = set()
+        while pending:
+            best = max(pending, key=lambda p: (len(bound.intersection(p[1])), len(p[1])))
+            pending.remove(best)
+            # a precondition whose variables are all bound by then is a lookup, not a scan
+            lookup = all(a in bound or a not in action.parameters for a in best[1])
+            self.joins.append((best[0], best[1], lookup))
+            bound.update(a for a in best[1] if a in action.parameters)
+        self.free = [p for p in self.params if p not in bound]
+        self.tail = len(self.joins)
+        while self.tail and self.joins[self.tail - 1][2]:
+            self.tail -= 1
+
+
+class LazyGrounder(object):
+    """
+    Successor generator for lazy grounding: candidates(state) yields the grounded
+    actions whose preconditions hold in state, grounding new bindings on demand
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.schemas = [_Schema(action) for action in parser.domain.actions]
+        self.agents = [agent.name for agent in parser.domain.agents]
+        self.object_types = parser.problem.object_types
+        self.objects_of = dict()
+        for ob, type_ in self.object_types.items():
+            self.objects_of.setdefault(type_, list()).append(ob)
+        self.init = set(parser.decode_state(parser.init_state))
+        self.memo = dict()
+
+    def candidates(self, state):
+        facts = self.parser.facts
+        index = dict()
+        for i in bits(state):
+            fact = facts[i]
+            index.setdefault(fact[0], list()).append(fact[1:])
+        for n, schema in enumerate(self.schemas):
+            for binding in self._join(schema, 0, dict(), state, index):
+                if not schema.free:
+                    for action in self._grounded(n, schema, binding):
+                        yield action
+                    continue
+                free = [self.objects_of.get(schema.action.parameters[p], ()) for p in schema.free]
+                if not all(free):
+                    continue
+                for values in product(*free):
+                    binding.update(zip(schema.free, values))
+                    for action in self._grounded(n, schema, binding):
+                        yield action
+                for p in schema.free:
+                    del binding[p]
+
+    def ground_key(self, name, agent, args):
+        """
+        The grounded action name(agent, args), as named by a plan store action key.
+        None if no schema of that name and arity can be run by agent on args
+        """
+        for n, schema in enumerate(self.schemas):
+            if schema.action.name == name and len(schema.params) == len(args):
+                for action in self._grounded(n, schema, dict(zip(schema.params, args))):
+                    if action.agent == agent:
+                        return action
+        return None
+
+    def _grounded(self, n, schema, binding):
+        args = tuple(binding[p] for p in schema.params)
+        grounded = self.memo.get((n, args))
+        if grounded is None:
+            grounded = self._ground(schema.action, args)
+            self.memo[(n, args)] = grounded
+        return grounded
+
+    def _join(self, schema, i, binding, state, index):
+        """
+        Yield every extension of binding that makes the preconditions from i on true
+        in state, whose facts are indexed by predicate. binding is updated in place
+        and restored on the way back
+        """
+        if i >= schema.tail:
+            # only lookups left
+            fact_ids = self.parser.fact_ids
+            for name, params, _ in schema.joins[i:]:
+                fid = fact_ids.get((name,) + tuple(binding.get(p, p) for p in params))
+                if fid is None or not state >> fid & 1:
+                    return
+            yield binding
+            return
+        name, params, _ = schema.joins[i]
+        types = schema.action.parameters
+        for args in index.get(name, ()):
+            if len(args) != len(params):
+                continue
+            added = list()
+            for p, ob in zip(params, args):
+                value = binding.get(p)
+                if value is None and p in types:
+                    if self.object_types.get(ob) != types[p]:
+                        break
+                    binding[p] = ob
+                    added.append(p)
+                elif (p if value is None else value) != ob:
+                    break
+            else:
+                for full in self._join(schema, i + 1, binding, state, index):
+                    yield full
+            for p in added:
+                del binding[p]
+
+    def _ground(self, schema, args):
+        """
+        Ground and compile schema(args) for every agent that can run it, with the
+        same filters as Domain.ground
+        """
+        parser = self.parser
+        grounded = list()
+        for agent in self.agents:
+            action = schema.ground(agent, args)
+            if not parser.feasible(action):
+                continue
+            if len(set(args)) < len(args) and not self._self_binding_ok(action.precondition + action.effects):
+                continue
+            parser.compile_action(action)
+            action.index = len(parser.grounded_actions)
+            parser.grounded_actions.append(action)
+            grounded.append(action)
+        return tuple(grounded)
+
+    def _self_binding_ok(self, facts):
+        for fact in facts:  # ('on', 'a1', 'D', 'D')
+            args = fact[2:]
+            if len(set(args)) < len(args) and fact[:1] + args not in self.init:
+                return False
+        return True
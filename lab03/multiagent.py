@@ -0,0 +1,160 @@
+import argparse
+import importlib
+from collections import deque
+
+from search import Stats
+from search import _identity
+from search import successors
+
+
+# Joint multi-agent plans for the lab03 parsers.
+# A joint step lets every agent run at most one action. Actions in one step
+# must not interfere: an action deletes its preconditions, so two actions may
+# share a step only if neither needs or deletes a fact the other deletes or
+# adds. Any order of such actions gives the same state, so a step is applied
+# as a whole: (state & ~pre) | add over the union of its masks.
+#
+#   python multiagent.py domain.json task.json            # minimum makespan
+#   python multiagent.py domain.json task.json --greedy   # A* plan, then scheduled
+
+def mutex(a, b):
+    """
+    True if the effects of grounded actions a and b depend on their order
+    """
+    return bool(a.pre_mask & (b.pre_mask | b.add_mask)) or bool(b.pre_mask & a.add_mask)
+
+
+def interferes(a, b):
+    """
+    True if grounded actions a and b cannot run in the same joint step
+    """
+    return a.agent == b.agent or mutex(a, b)
+
+
+def joint_steps(parser, state, agents, stats=None):
+    """
+    Yield (step, new_state) for every non-empty set of pairwise non-interfering
+    actions applicable in state, at most one per agent
+    """
+    groups = dict((agent, list()) for agent in agents)
+    for action, _ in successors(parser, state, stats):
+        groups[action.agent].append(action)
+    groups = [g for g in groups.values() if g]
+    chosen = list()
+
+    def extend(i, pre, add):
+        if i == len(groups):
+            if chosen:
+                yield list(chosen), (state & ~pre) | add
+            return
+        for step in extend(i + 1, pre, add):
+            yield step
+        for action in groups[i]:
+            if action.pre_mask & (pre | add) or pre & action.add_mask:
+                continue
+            chosen.append(action)
+            for step in extend(i + 1, pre | action.pre_mask, add | action.add_mask):
+                yield step
+            chosen.pop()
+
+    return extend(0, 0, 0)
+
+
+def makespan_bfs(parser, start, goal, stats=None, key=None):
+    """
+    Breadth-first search over joint steps with the goal tested on generation, so
+    the first plan found has the smallest number of steps (makespan). Returns a list of steps, each a list of
+    grounded actions, or None
+    """
+    if stats is None:
+        stats = Stats()
+    if key is None:
+        key = _identity
+    agents = [agent.name for agent in parser.domain.agents]
+    parents = {key(start): None}
+    if start & goal == goal:
+        return []
+    queue = deque([start])
+    while queue:
+        cur_state = queue.popleft()
+        stats.expanded += 1
+        for step, new_state in joint_steps(parser, cur_state, agents, stats):
+            stats.generated += 1
+            new_key = key(new_state)
+            if new_key in parents:
+                stats.duplicates += 1
+                continue
+            parents[new_key] = (cur_state, step)
+            if new_state & goal == goal:
+                plan = list()
+                while parents[key(new_state)] is not None:
+                    new_state, step = parents[key(new_state)]
+                    plan.append(step)
+                plan.reverse()
+                return plan
+            queue.append(new_state)
+        stats.peak_frontier = max(stats.peak_frontier, len(queue))
+    return None
+
+
+def schedule(plan, grounded_actions=()):
+    """
+    Compress a sequential plan into joint steps: every action goes to the first
+    step after all earlier actions it is mutex with, handed to another agent with
+    an identical grounded action when its own agent is busy there. Cheap, but
+    only as good as the order of the input plan
+    """
+    variants = dict()
+    for action in grounded_actions:
+        variants.setdefault((action.pre_mask, action.add_mask), list()).append(action)
+    steps = list()
+    for action in plan:
+        t = 0
+        for i in range(len(steps) - 1, -1, -1):
+            if any(mutex(action, other) for other in steps[i]):
+                t = i + 1
+                break
+        choices = variants.get((action.pre_mask, action.add_mask), [action])
+        while True:
+            if t == len(steps):
+                steps.append(list())
+            busy = set(other.agent for other in steps[t])
+            free = [a for a in choices if a.agent not in busy]
+            if free:
+                steps[t].append(action if action in free else free[0])
+                break
+            t += 1
+    return steps
+
+
+def format_plan(steps):
+    lines = list()
+    for t, step in enumerate(steps):
+        lines.append("%d: %s" % (t, ', '.join('%s %s %s' % (a.agent, a.name, ' '.join(a.args)) for a in step)))
+    return lines
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Plan with joint steps for all agents")
+    ap.add_argument('domain', nargs='?', default='domain.json')
+    ap.add_argument('problem', nargs='?', default='task01.json')
+    ap.add_argument('--parser', default='parser_agents', choices=['parser_agents', 'parser_pickle'])
+    ap.add_argument('--greedy', action='store_true', help="schedule an A* plan instead of searching joint steps")
+    ap.add_argument('--heuristic', default='goal_count')
+    args = ap.parse_args(argv)
+
+    parser = importlib.import_module(args.parser).Parser(args.domain, args.problem)
+    parser.parse_domain()
+    parser.parse_problem()
+    steps = parser.joint_planner(optimal=not args.greedy, heuristic=args.heuristic)
+    if steps is None:
+        print("no solution")
+        return
+    print("makespan %d, %d actions" % (len(steps), sum(len(step) for step in steps)))
+    for line in format_plan(steps):
+        print(line)
+    print(parser.stats)
+
+
+if __name__ == "__main__":
+    main()
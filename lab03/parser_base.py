@@ -0,0 +1,645 @@
+import json
+import time
+from itertools import product
+
+import hda
+import heuristics
+import lazy
+import multiagent
+import plan_store
+import profiling
+import replan
+import search
+import symmetry
+import task_cache
+import vector
+
+
+# Domain, problem and search front end shared by parser_agents and
+# parser_pickle. The two parsers differ only in their agent model: a subclass
+# of BaseParser supplies the Agent class (agent_class) and the capacity_table
+# and feasible rules that filter grounded actions.
+
+# Domain
+
+class Predicate:
+    __slots__ = ('name', 'parameters')
+
+    def __init__(self, name, parameters):
+        self.name = name.lower()
+        self.parameters = parameters
+
+
+# class Object:
+#    def __init__(self, name, typeName):
+#        self.name = name.lower()
+#        self.typeName = typeName
+
+class Action:
+    __slots__ = ('name', 'parameters', 'precondition', 'effect', 'unique')
+
+    def __init__(self, name, param, unique=False):
+        self.name = name.lower()
+        params = dict()
+        for i, j in param["parameters"].items():
+            for k in j:
+                params[k] = i
+        self.parameters = params
+        self.precondition = param["precondition"]
+        self.effect = param["effect"]
+        self.unique = unique
+
+    def ground(self, agent, args):
+        return _GroundedAction(self, agent, args)
+
+
+class Domain:
+    def __init__(self, name, requirements=None, types=None, predicates=None, actions=None, agents=None):
+        self.name = name.lower()
+        self.requirements = requirements
+        self.types = types
+        if predicates == None:
+            self.predicates = []
+        else:
+            self.predicates = predicates
+        if actions == None:
+            self.actions = []
+        else:
+            self.actions = actions
+        if agents == None:
+            self.agents = []
+        else:
+            self.agents = agents
+
+    def ground(self, objects, init=None, feasible=None):
+        """
+        Ground all action schemas given a dictionary of objects keyed by type.
+        Actions rejected by the feasible callback (agent capacity) are discarded.
+        Parameters only range over objects of their declared type, and bindings
+        that reuse an object for several parameters are dropped unless every
+        repeated-argument fact they mention (e.g. on(D, D)) is in init.
+        When init facts are given, only relaxed-reachable actions are kept
+        """
+        init = set() if init is None else set(init)
+        agent_list = [x.name for x in self.agents]
+        grounded_actions = list()
+        for action in self.actions:
+            param_lists = [[ob for ob, type_ in objects.items() if type_ == t] for t in action.parameters.values()]
+            for params in product(agent_list, product(*param_lists)):
+                a = action.ground(*params)
+                if feasible is not None and not feasible(a):
+                    continue
+                if len(set(params[1])) < len(params[1]) and not _self_binding_ok(a.precondition + a.effects, init):
+                    continue
+                grounded_actions.append(a)
+        if init:
+            grounded_actions = relaxed_reachable(grounded_actions, init)
+        return grounded_actions
+
+
+def _self_binding_ok(facts, init):
+    for fact in facts:  # ('on', 'a1', 'D', 'D')
+        args = fact[2:]
+        if len(set(args)) < len(args) and fact[:1] + args not in init:
+            return False
+    return True
+
+
+def relaxed_reachable(grounded_actions, init):
+    """
+    Relaxed reachability fixpoint (deletes ignored): keep the actions whose
+    preconditions can all become true starting from the agent-free init facts
+    """
+    reached = set(init)
+    pending = list(grounded_actions)
+    kept = set()
+    changed = True
+    while changed:
+        changed = False
+        rest = list()
+        for a in pending:
+            if all(p[:1] + p[2:] in reached for p in a.precondition):
+                kept.add(id(a))
+                reached.update(e[:1] + e[2:] for e in a.effects)
+                changed = True
+            else:
+                rest.append(a)
+        pending = rest
+    return [a for a in grounded_actions if id(a) in kept]
+
+
+def parse_domain_def(dom_dict, agent_class):
+    """
+    Parse a domain dict, creating its agents with agent_class(name, weight)
+    """
+    name = dom_dict["domain"]
+    domain = Domain(name)
+
+    for key, attr in dom_dict.items():
+        if key == "types":
+            domain.types = attr
+        elif key == "predicates":
+            for pred, d in attr.items():
+                p = Predicate(pred, d)
+                domain.predicates.append(p)
+        elif key == "agents":
+            for agent, w in attr.items():
+                a = agent_class(agent, w)
+                domain.agents.append(a)
+        elif key == "action":
+            for action, d in attr.items():
+                a = Action(action, d)
+                domain.actions.append(a)
+            break
+    return domain
+
+
+# Problem
+
+class Problem:
+    def __init__(self, name, objects=None, init=None, goal=None):
+        self.name = name
+        self.object_types = dict()
+        if objects == None:
+            self.objects = dict()
+        else:
+            self.objects = predicates
+        if init == None:
+            self.initial_state = []
+        else:
+            self.initial_state = init
+        if goal == None:
+            self.goal = []
+        else:
+            self.goal = goal
+
+
+def parse_problem_def(prob_dict):
+    """Main method to parse a problem definition."""
+    name = prob_dict["name"]
+    problem = Problem(name)
+    for key, attr in prob_dict.items():
+        if key == "objects":
+            for type_, obj in attr.items():
+                for ob, w in obj.items():
+                    # o = Object(ob, type_)
+                    problem.objects[ob] = w
+                    problem.object_types[ob] = type_
+        elif key == "init":
+            p = []
+            for pred, d in attr.items():
+                pr = Predicate(pred, d)
+                p.append(pr)
+            problem.initial_state = p
+        elif key == "goal":
+            p = []
+            for pred, d in attr.items():
+                pr = Predicate(pred, d)
+                p.append(pr)
+            problem.goal = p
+            break
+    return problem
+
+
+def to_facts(predicates):
+    """
+    Flatten parsed predicates into agent-free ground facts such as ('on', 'D', 'C')
+    """
+    return [(st.name, param[0], param[1]) if isinstance(st.parameters[0], list) else (st.name, param)
+            for st in predicates for param in st.parameters]
+
+
+def _ground_facts(schema, agent, binding):
+    """
+    Ground the facts of an action schema for one agent, e.g. on(?x, ?y) -> ('on', 'a1', 'D', 'C')
+    """
+    return tuple((name, agent) + tuple(binding.get(p, p) for p in params)
+                 for name, params in schema.items() if params[0] in binding)
+
+
+class _GroundedAction(object):
+    """
+    An action schema that has been grounded with objects. Preconditions and effects
+    are fact tuples with the agent column until Parser.compile replaces them by
+    tuples of fact IDs
+    """
+    __slots__ = ('name', 'agent', 'args', 'precondition', 'effects', 'pre_mask', 'del_mask', 'add_mask', 'index')
+
+    def __init__(self, action, agent, args):
+        self.name = action.name
+        self.agent = agent
+        self.args = args
+        binding = dict(zip(action.parameters, args))
+        self.precondition = _ground_facts(action.precondition, agent, binding)
+        self.effects = _ground_facts(action.effect, agent, binding)
+
+    def __str__(self):
+        return '(%s %s %s)' % (self.name, self.agent, ' '.join(self.args))
+
+
+# Parser
+
+class BaseParser:
+    """
+    Parser and planner front end for one domain and problem. Subclasses set
+    agent_class and variant and implement capacity_table and feasible
+    """
+    agent_class = None
+    # stable name of the agent model, part of the task cache key
+    variant = None
+
+    def __init__(self, domFile, probFile, symmetry=False, lazy=False):
+        self.domFile = domFile
+        self.probFile = probFile
+        self.domInput = {}
+        self.probInput = {}
+        self.domain = None
+        self.problem = None
+        self.facts = list()
+        self.fact_ids = dict()
+        self.stats = None
+        self.capacity = dict()
+        self.symmetry = symmetry
+        self.lazy = lazy
+        self.vector_task = None
+        self.plan_db = 'plan.db'
+        self.state_key = None
+        self.replanner = None
+        self.task_cache = None
+        self.profile = None
+
+    def enable_profiling(self, cprofile=False, memory=False):
+        """
+        Attach a profiling.Profile collecting phase times and counters of this
+        parser, optionally with cProfile and tracemalloc captures
+        """
+        profiling.instrument(self, profiling.Profile(cprofile, memory))
+        return self.profile
+
+    def fact_id(self, fact):
+        """
+        Intern an agent-free ground fact, returning its bit position in the state encoding
+        """
+        idx = self.fact_ids.get(fact)
+        if idx is None:
+            idx = len(self.facts)
+            self.fact_ids[fact] = idx
+            self.facts.append(fact)
+        return idx
+
+    def encode_state(self, facts):
+        state = 0
+        for fact in facts:
+            state |= 1 << self.fact_id(fact)
+        return state
+
+    def decode_state(self, state, agent=None):
+        """
+        Expand a bitset state back into fact tuples, optionally tagged with an agent column
+        """
+        facts = [fact for i, fact in enumerate(self.facts) if state >> i & 1]
+        if agent is None:
+            return facts
+        return [fact[:1] + (agent,) + fact[1:] for fact in facts]
+
+    def compile(self):
+        """
+        Intern all ground facts and precompile grounded actions into bit masks:
+        an action deletes its preconditions and adds the rest of its effects
+        """
+        self.init_state = self.encode_state(to_facts(self.problem.initial_state))
+        self.goal_state = self.encode_state(to_facts(self.problem.goal))
+        for action in self.grounded_actions:
+            self.compile_action(action)
+        self.index_actions()
+
+    def compile_action(self, action):
+        action.pre_mask = self.encode_state(x[:1] + x[2:] for x in action.precondition)
+        action.del_mask = action.pre_mask
+        action.add_mask = self.encode_state(x[:1] + x[2:] for x in action.effects) & ~action.pre_mask
+        action.precondition = tuple(search.bits(action.pre_mask))
+        action.effects = tuple(search.bits(action.add_mask))
+
+    def index_actions(self):
+        """
+        Merge symmetric actions, number the rest (search trees refer to actions by
+        index) and build the successor and predecessor indexes. With lazy grounding
+        the successor generator grounds actions itself and there is no regression
+        """
+        self.vector_task = None
+        if self.lazy:
+            if self.symmetry:
+                raise ValueError("symmetry merging needs every grounded action, parse without lazy=True")
+            self.successor_generator = lazy.LazyGrounder(self)
+            self.predecessor_generator = None
+            return
+        if self.symmetry:
+            self.grounded_actions = symmetry.merge_equivalent_actions(self.grounded_actions)
+            self.state_key = symmetry.Canonicalizer(self)
+        for i, action in enumerate(self.grounded_actions):
+            action.index = i
+        self.successor_generator = search.SuccessorGenerator(self.grounded_actions)
+        self.predecessor_generator = search.PredecessorGenerator(self.grounded_actions)
+
+    def get_state(self, cur_state, action):
+        return (cur_state & ~action.del_mask) | action.add_mask
+
+    def capacity_table(self):
+        """
+        Static (agent, object) feasibility table, consulted by feasible
+        """
+        return dict()
+
+    def feasible(self, action):
+        return True
+
+    def require_grounding(self, what):
+        if self.lazy:
+            raise ValueError("%s needs every grounded action, parse without lazy=True" % what)
+
+    def gettable(self, cur_state, action):
+        return (cur_state & action.pre_mask) == action.pre_mask
+
+    @profiling.timed('parse_domain')
+    def parse_domain(self):
+        # without a file name, domInput has been set by the caller (service.py)
+        if self.domFile is not None:
+            with open(self.domFile, 'rb') as f:
+                self.domInput = json.loads(f.read())
+
+        domain = parse_domain_def(self.domInput, self.agent_class)
+        self.domain = domain
+
+    @profiling.timed('parse_problem')
+    def parse_problem(self):
+        if self.probFile is not None:
+            with open(self.probFile, 'rb') as f:
+                self.probInput = json.loads(f.read())
+
+        problem = parse_problem_def(self.probInput)
+        self.problem = problem
+        self.capacity = self.capacity_table()
+        self.problem_key = plan_store.problem_key(self.domInput, self.probInput)
+        path = self.task_cache_path()
+        if path is not None:
+            with profiling.phase(self, 'task_cache'):
+                cached = task_cache.load_task(self, path)
+            if self.profile is not None:
+                self.profile.count('task_cache_hits' if cached else 'task_cache_misses')
+            if cached:
+                with profiling.phase(self, 'index'):
+                    self.index_actions()
+                return
+        with profiling.phase(self, 'ground'):
+            if self.lazy:
+                self.grounded_actions = list()
+            else:
+                self.grounded_actions = self.domain.ground(self.problem.object_types,
+                                                           to_facts(self.problem.initial_state), self.feasible)
+        with profiling.phase(self, 'compile'):
+            self.compile()
+        if path is not None:
+            with profiling.phase(self, 'task_cache'):
+                task_cache.save_task(self, path)
+
+    def task_cache_path(self):
+        """
+        Cache file of the compiled task, None when caching is off, grounding is lazy
+        or this parser already numbers facts of an earlier problem
+        """
+        if self.task_cache is None or self.lazy or self.facts:
+            return None
+        key = task_cache.task_key(self.variant, self.domInput, self.probInput, self.symmetry)
+        return task_cache.task_path(self.task_cache, key)
+
+    def _start_state(self, state):
+        """
+        Start of a search: the initial state by default, predicates are encoded.
+        Resets the node counters in self.stats
+        """
+        self.stats = search.Stats()
+        if state is None:
+            return self.init_state
+        if not isinstance(state, int):
+            return self.encode_state(to_facts(state))
+        return state
+
+    def heuristic(self, states, goal):
+        h_states = set()
+        for state in states:
+            c = bin(state & goal).count("1")
+            h_states.add((state, c))
+        return h_states
+
+    @profiling.timed('bfs')
+    def bfs_planner(self, state=None, backend='python'):
+        """
+        Breadth-first search from state (the initial state by default) to the goal.
+        backend='numpy' expands whole layers with vector.VectorTask instead.
+        Returns the plan as a list of grounded actions, None if there is no solution;
+        node counters are left in self.stats
+        """
+        state = self._start_state(state)
+        if backend == 'numpy':
+            self.require_grounding('the numpy backend')
+            if self.vector_task is None:
+                self.vector_task = vector.VectorTask(self)
+            plan, parents = vector.bfs(self, state, self.goal_state, self.stats, self.state_key, self.vector_task)
+        elif backend == 'python':
+            plan, parents = search.bfs(self, state, self.goal_state, self.stats, self.state_key)
+        else:
+            raise ValueError("unknown backend %r, expected 'python' or 'numpy'" % backend)
+        return plan
+
+    @profiling.timed('bidir')
+    def bidirectional_planner(self, state=None):
+        """
+        Breadth-first search from both ends, regressing from the goal state.
+        Returns a plan of the same length as bfs_planner while exploring far fewer states
+        """
+        self.require_grounding('regression')
+        state = self._start_state(state)
+        return search.bidirectional(self, state, self.goal_state, self.stats)
+
+    @profiling.timed('hda')
+    def parallel_planner(self, workers=None, state=None):
+        """
+        Hash-distributed breadth-first search over worker processes (all cores by
+        default). Returns a plan of the same length as bfs_planner
+        """
+        self.require_grounding('parallel search')
+        state = self._start_state(state)
+        return hda.hda_bfs(self, state, self.goal_state, workers, self.stats)
+
+    @profiling.timed('joint')
+    def joint_planner(self, optimal=True, state=None, heuristic='goal_count'):
+        """
+        Multi-agent plan as a list of joint steps, each a list of non-interfering
+        grounded actions by different agents. optimal=True searches joint steps for
+        the smallest makespan, otherwise an A* plan is scheduled into steps greedily
+        """
+        if self.symmetry:
+            raise ValueError("joint plans need the actions of every agent, parse without symmetry")
+        state = self._start_state(state)
+        if optimal:
+            return multiagent.makespan_bfs(self, state, self.goal_state, self.stats)
+        plan = self.astar_planner(state=state, heuristic=heuristic)
+        return None if plan is None else multiagent.schedule(plan, self.grounded_actions)
+
+    @profiling.timed('astar')
+    def astar_planner(self, save=False, state=None, heuristic='goal_count'):
+        """
+        A* from state (the initial state by default) to the goal, guided by one of
+        heuristics.HEURISTICS. Returns the plan as a list of grounded actions, None
+        if there is no solution; node counters are left in self.stats
+        """
+        state = self._start_state(state)
+        h = heuristics.make_heuristic(heuristic, self)
+        plan, parents = search.astar(self, state, self.goal_state, h, self.stats, self.state_key)
+        if save and plan is not None:
+            self.save_plan(parents)
+        return plan
+
+    @profiling.timed('idastar')
+    def idastar_planner(self, state=None, heuristic='goal_count'):
+        """
+        Iterative-deepening A*: memory only grows with the plan length, at the
+        price of re-expanding states in every iteration
+        """
+        state = self._start_state(state)
+        h = heuristics.make_heuristic(heuristic, self)
+        return search.idastar(self, state, self.goal_state, h, self.stats, self.state_key)
+
+    @profiling.timed('smastar')
+    def smastar_planner(self, max_nodes=100000, state=None, heuristic='goal_count'):
+        """
+        A* keeping at most max_nodes search nodes, forgetting the worst leaves when
+        the limit is hit. Returns None if no plan fits into that memory
+        """
+        state = self._start_state(state)
+        h = heuristics.make_heuristic(heuristic, self)
+        return search.smastar(self, state, self.goal_state, h, self.stats, self.state_key, max_nodes)
+
+    def print_plan(self, plan, state=None, file=None):
+        """
+        Replay a plan from state, printing the acting agent and every visited state
+        to file (stdout by default)
+        """
+        if state == None:
+            state = self.init_state
+        print("Init state:\n", self.decode_state(state, 'Null'), file=file)
+        print("Goal state:\n", self.decode_state(self.goal_state), file=file)
+        print(file=file)
+        if plan is None:
+            print("no solution", file=file)
+            return
+        print("Plan:", file=file)
+        print("AGENT - ", 'Null', file=file)
+        print("STATE - ", self.decode_state(state, 'Null'), file=file)
+        print(file=file)
+        for action in plan:
+            state = self.get_state(state, action)
+            print("AGENT - ", action.agent, file=file)
+            print("STATE - ", self.decode_state(state, action.agent), file=file)
+            print(file=file)
+
+    def iter_plans(self, heuristic='goal_count', weights=(5, 3, 2, 1.5, 1), progress_every=10000, state=None):
+        """
+        Anytime weighted A*: search again with each weight in turn, pruning paths
+        that are no shorter than the best plan so far. Yields event dicts:
+        'progress' every progress_every expansions, 'plan' for each improved plan
+        and a final 'done' carrying the best plan (None if there is no solution)
+        """
+        state = self._start_state(state)
+        h = heuristics.make_heuristic(heuristic, self)
+        start = time.perf_counter()
+        best = None
+        for weight in weights:
+            bound = None if best is None else len(best)
+            for event in search.iter_astar(self, state, self.goal_state, h, self.stats, self.state_key, weight,
+                                           bound, progress_every):
+                if event[0] == 'progress':
+                    yield {'event': 'progress', 'weight': weight, 'time': time.perf_counter() - start,
+                           'expanded': self.stats.expanded, 'generated': self.stats.generated,
+                           'peak_frontier': self.stats.peak_frontier}
+            plan = event[1]
+            if plan is not None and (best is None or len(plan) < len(best)):
+                best = plan
+                yield {'event': 'plan', 'weight': weight, 'time': time.perf_counter() - start,
+                       'plan': plan, 'length': len(plan)}
+        yield {'event': 'done', 'time': time.perf_counter() - start, 'plan': best,
+               'length': None if best is None else len(best)}
+
+    @profiling.timed('anytime')
+    def anytime_planner(self, heuristic='goal_count', time_limit=None, reporter=None, state=None):
+        """
+        Drive iter_plans, passing every event to reporter (a callable such as
+        reporter.ConsoleReporter). Stops at the first event past time_limit seconds
+        and returns the best plan found so far
+        """
+        best = None
+        for event in self.iter_plans(heuristic, state=state):
+            if reporter is not None:
+                reporter(event)
+            if event['event'] in ('plan', 'done'):
+                best = event['plan']
+            if time_limit is not None and event['time'] > time_limit:
+                break
+        return best
+
+    @profiling.timed('gbfs')
+    def gbfs_planner(self, save=False, state=None, heuristic=None):
+        """
+        Greedy best-first search guided by one of heuristics.HEURISTICS, h_ff by
+        default (goal_count with lazy grounding, where the relaxed heuristics are not
+        available). Plans are found fast but are not necessarily the shortest
+        """
+        if heuristic is None:
+            heuristic = 'goal_count' if self.lazy else 'h_ff'
+        state = self._start_state(state)
+        h = heuristics.make_heuristic(heuristic, self)
+        plan, parents = search.gbfs(self, state, self.goal_state, h, self.stats, self.state_key)
+        if save and plan is not None:
+            self.save_plan(parents)
+        return plan
+
+    @profiling.timed('incremental')
+    def incremental_planner(self, probFile=None):
+        """
+        Lifelong Planning A* that keeps its search tree on this parser. Passing a
+        changed problem file re-parses it and only repairs the affected part of the
+        tree; the domain and the fact numbering stay as they are
+        """
+        self.require_grounding('incremental search')
+        if self.replanner is None:
+            self.replanner = replan.LifelongPlanner(self)
+        self.replanner.stats = search.Stats()
+        if probFile is None:
+            plan = self.replanner.plan()
+        else:
+            plan = self.replanner.update(probFile)
+        self.stats = self.replanner.stats
+        return plan
+
+    @profiling.timed('save_plan')
+    def save_plan(self, parents, path=None):
+        """
+        Add the transitions of a search tree (key(new_state): (cur_state, action index)) to the plan
+        store at path (self.plan_db by default)
+        """
+        if path is None:
+            path = self.plan_db
+        keys = dict()
+
+        def key(st):
+            if st not in keys:
+                keys[st] = plan_store.state_key(self.decode_state(st))
+            return keys[st]
+
+        edges = list()
+        for y in parents.values():
+            if y is not None:
+                action = self.grounded_actions[y[1]]
+                edges.append((key(y[0]), plan_store.action_key(action), key(self.get_state(y[0], action))))
+        with plan_store.PlanStore(path) as store:
+            store.save(self.problem_key, edges)
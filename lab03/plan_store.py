@@ -0,0 +1,63 @@
+import hashlib
+import json
+import sqlite3
+
+
+# Persistent plan cache used by parser_pickle.
+# Every saved search contributes its transitions (state, action, new_state)
+# to a sqlite table keyed by the problem hash, with the parent state as the
+# leading key column so the children of a state are a single index lookup.
+
+def problem_key(dom_input, prob_input):
+    """
+    Hash of everything that fixes the transition system: the domain and the
+    problem objects (with their weights). Init and goal are left out so that
+    problems differing only there share cached transitions
+    """
+    canon = json.dumps([dom_input, prob_input.get("objects")], sort_keys=True)
+    return hashlib.sha1(canon.encode()).hexdigest()
+
+
+def state_key(facts):
+    """
+    Canonical text form of a set of agent-free facts, independent of fact numbering
+    """
+    return ';'.join(sorted(' '.join(fact) for fact in facts))
+
+
+def action_key(action):
+    return ' '.join((action.name, action.agent) + tuple(action.args))
+
+
+class PlanStore(object):
+    def __init__(self, path='plan.db'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS edges ("
+                          "problem TEXT, state TEXT, action TEXT, new_state TEXT, "
+                          "PRIMARY KEY (problem, state, action)) WITHOUT ROWID")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def save(self, problem, edges):
+        """
+        Store an iterable of (state_key, action_key, new_state_key) transitions
+        """
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO edges VALUES (?, ?, ?, ?)",
+                                  ((problem,) + tuple(edge) for edge in edges))
+
+    def children(self, problem, state):
+        """
+        Cached (action_key, new_state_key) transitions out of state
+        """
+        return self.conn.execute("SELECT action, new_state FROM edges WHERE problem = ? AND state = ?",
+                                 (problem, state)).fetchall()
@@ -0,0 +1,163 @@
+import cProfile
+import contextlib
+import functools
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+
+# Instrumentation for the lab03 parsers. Nothing here costs anything until
+# Parser.enable_profiling() attaches a Profile: planner methods are wrapped
+# with @timed, which is a plain call while parser.profile is None, and
+# heuristics are only wrapped for a profiled parser. Applicability checks and
+# generated successors are counted by the search engines in their Stats, which
+# @timed adds to the profile counters.
+#
+#   parser.enable_profiling(cprofile=True, memory=True)
+#   parser.parse_domain(); parser.parse_problem(); parser.astar_planner()
+#   parser.profile.dump('profile.json')
+
+class Profile(object):
+    """
+    Per-phase wall times, call counters, search counters and, on request,
+    cProfile and tracemalloc captures of the outermost phases
+    """
+
+    def __init__(self, cprofile=False, memory=False, top=25):
+        self.times = dict()
+        self.calls = dict()
+        self.counters = dict()
+        self.peak_kb = dict()
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.memory = memory
+        self.top = top
+        self.depth = 0
+        # tracemalloc was started by this profile and is stopped after the phase
+        self.tracing = False
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        outer = self.depth == 0
+        if outer:
+            if self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self.tracing = True
+                tracemalloc.reset_peak()
+            if self.cprofile is not None:
+                self.cprofile.enable()
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+            self.depth -= 1
+            if outer:
+                if self.cprofile is not None:
+                    self.cprofile.disable()
+                if self.memory:
+                    peak = tracemalloc.get_traced_memory()[1] // 1024
+                    self.peak_kb[name] = max(self.peak_kb.get(name, 0), peak)
+                    if self.tracing:
+                        tracemalloc.stop()
+                        self.tracing = False
+
+    def add_search(self, stats):
+        for name, value in stats.as_dict().items():
+            if name == 'peak_frontier':
+                self.counters[name] = max(self.counters.get(name, 0), value)
+            else:
+                self.count(name, value)
+
+    def counted(self, name, fn):
+        """
+        Wrap fn so that its calls and total time are recorded under name
+        """
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add_time(name, time.perf_counter() - start)
+        return run
+
+    def cprofile_top(self):
+        if self.cprofile is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.cprofile, stream=out).sort_stats('cumulative').print_stats(self.top)
+        return out.getvalue()
+
+    def as_dict(self):
+        return {
+            'times_s': dict((k, round(v, 6)) for k, v in self.times.items()),
+            'calls': dict(self.calls),
+            'counters': dict(self.counters),
+            'peak_kb': dict(self.peak_kb) if self.memory else None,
+            'cprofile': self.cprofile_top(),
+        }
+
+    def dump(self, path):
+        """
+        Write as_dict() to path as JSON. With cProfile on, the raw profile goes
+        next to it as <path>.prof for pstats or snakeviz
+        """
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(path + '.prof')
+
+    def __str__(self):
+        lines = ["%-24s %10.4fs %9d calls" % (k, v, self.calls[k])
+                 for k, v in sorted(self.times.items(), key=lambda kv: -kv[1])]
+        lines += ["%-24s %10d" % kv for kv in sorted(self.counters.items())]
+        return '\n'.join(lines)
+
+
+def phase(parser, name):
+    """
+    Context manager timing a phase of parser, a no-op without a profile
+    """
+    if parser.profile is None:
+        return contextlib.nullcontext()
+    return parser.profile.phase(name)
+
+
+def timed(name):
+    """
+    Method decorator: run the method as phase name of self.profile and add the
+    search counters it leaves in self.stats
+    """
+    def wrap(method):
+        @functools.wraps(method)
+        def run(self, *args, **kwargs):
+            profile = self.profile
+            if profile is None:
+                return method(self, *args, **kwargs)
+            outer = profile.depth == 0
+            before = self.stats
+            with profile.phase(name):
+                result = method(self, *args, **kwargs)
+            if outer and self.stats is not None and self.stats is not before:
+                profile.add_search(self.stats)
+            return result
+        return run
+    return wrap
+
+
+def instrument(parser, profile):
+    """
+    Attach profile to one parser instance
+    """
+    parser.profile = profile
@@ -0,0 +1,193 @@
+import heapq
+from itertools import count
+
+from search import INF
+from search import Stats
+from search import predecessors
+from search import successors
+import plan_store
+
+
+# Incremental replanning with Lifelong Planning A* (LPA*).
+# The planner keeps g/rhs values of the states it has seen across problem
+# changes. When the initial state, goal or object weights change, only the
+# states whose best path is affected are brought back onto the open list:
+#   - a new goal re-keys the open list, all g values stay valid
+#   - a new initial state only touches the old and the new start
+#   - actions gained or lost through weight changes update the successors
+#     they produce from already seen states
+# Goals are partial: every state containing the goal facts is a goal, so the
+# search stops at the cheapest consistent one (a virtual goal vertex).
+# Predecessors come from the regression in search.predecessors, so the parser
+# has to keep its fact numbering, which Parser.parse_problem does when it is
+# called again on the same object.
+
+class LifelongPlanner(object):
+    def __init__(self, parser):
+        self.parser = parser
+        self.stats = Stats()
+        self.g = dict()
+        self.rhs = dict()
+        self.open = dict()
+        self.heap = list()
+        self.tie = count()
+        self.start = parser.init_state
+        self.goal = parser.goal_state
+        self.max_add = self._max_add()
+        self.actions = self._action_table()
+        self.goal_heap = list()
+        self.rhs[self.start] = 0
+        self._push(self.start)
+
+    def _action_table(self):
+        return dict((plan_store.action_key(a), a) for a in self.parser.grounded_actions)
+
+    def _max_add(self):
+        return max([bin(a.add_mask).count("1") for a in self.parser.grounded_actions] + [1])
+
+    def h(self, state):
+        """
+        Missing goal facts divided by the most facts one action can add, which is
+        consistent, as LPA* needs
+        """
+        missing = bin(self.goal & ~state).count("1")
+        return -(-missing // self.max_add)
+
+    def key(self, state):
+        k = min(self.g.get(state, INF), self.rhs.get(state, INF))
+        return (k + self.h(state), k)
+
+    def _push(self, state):
+        k = self.key(state)
+        self.open[state] = k
+        heapq.heappush(self.heap, (k, next(self.tie), state))
+
+    def _top_key(self):
+        while self.heap:
+            k, _, state = self.heap[0]
+            if self.open.get(state) == k:
+                return k
+            heapq.heappop(self.heap)
+        return (INF, INF)
+
+    def _consistent(self, state):
+        g = self.g.get(state, INF)
+        if g != INF and state & self.goal == self.goal:
+            heapq.heappush(self.goal_heap, (g, next(self.tie), state))
+
+    def goal_value(self):
+        """
+        (g, state) of the cheapest locally consistent state satisfying the goal
+        """
+        while self.goal_heap:
+            g, _, state = self.goal_heap[0]
+            if self.g.get(state, INF) == g == self.rhs.get(state, INF) and state & self.goal == self.goal:
+                return g, state
+            heapq.heappop(self.goal_heap)
+        return INF, None
+
+    def update_vertex(self, state):
+        if state != self.start:
+            best = INF
+            for action, old_state in predecessors(self.parser, state, self.stats):
+                g = self.g.get(old_state, INF) + 1
+                if g < best:
+                    best = g
+            self.rhs[state] = best
+        if self.g.get(state, INF) != self.rhs.get(state, INF):
+            self._push(state)
+        else:
+            self.open.pop(state, None)
+            self._consistent(state)
+
+    def compute_shortest_path(self):
+        while True:
+            value = self.goal_value()[0]
+            if not self.open or self._top_key() >= (value, value):
+                break
+            k, _, state = heapq.heappop(self.heap)
+            del self.open[state]
+            self.stats.expanded += 1
+            g_new = self.rhs.get(state, INF)
+            if self.g.get(state, INF) > g_new:
+                self.g[state] = g_new
+                self._consistent(state)
+                for action, new_state in successors(self.parser, state, self.stats):
+                    self.stats.generated += 1
+                    if new_state != self.start and g_new + 1 < self.rhs.get(new_state, INF):
+                        self.rhs[new_state] = g_new + 1
+                        self._push(new_state)
+            else:
+                self.g[state] = INF
+                self.update_vertex(state)
+                for action, new_state in successors(self.parser, state, self.stats):
+                    self.stats.generated += 1
+                    self.update_vertex(new_state)
+            self.stats.peak_frontier = max(self.stats.peak_frontier, len(self.open))
+
+    def plan(self):
+        """
+        Bring the search up to date and return the plan as a list of grounded
+        actions, None if the goal is unreachable
+        """
+        self.compute_shortest_path()
+        value, state = self.goal_value()
+        if state is None:
+            return None
+        plan = list()
+        while state != self.start:
+            g = self.g[state]
+            for action, old_state in predecessors(self.parser, state):
+                if self.g.get(old_state, INF) + 1 == g:
+                    plan.append(action)
+                    state = old_state
+                    break
+            else:
+                return None
+        plan.reverse()
+        return plan
+
+    def update(self, probFile):
+        """
+        Switch to a slightly different problem file over the same domain, keeping
+        the search tree, and return the new plan
+        """
+        old_actions = self.actions
+        old_start = self.start
+        old_goal = self.goal
+        self.parser.probFile = probFile
+        self.parser.parse_problem()
+        self.actions = self._action_table()
+        self.start = self.parser.init_state
+        self.goal = self.parser.goal_state
+
+        changed = [a for k, a in old_actions.items() if k not in self.actions]
+        changed += [a for k, a in self.actions.items() if k not in old_actions]
+        if changed:
+            self.max_add = self._max_add()
+            seen = [s for s, g in self.g.items() if g != INF]
+            for action in changed:
+                for state in seen:
+                    if (state & action.pre_mask) == action.pre_mask:
+                        self.update_vertex(self.parser.get_state(state, action))
+
+        if self.start != old_start:
+            self.rhs[self.start] = 0
+            self.update_vertex(self.start)
+            self.update_vertex(old_start)
+
+        if self.goal != old_goal or changed:
+            # the heuristic moved with the goal: re-key the whole open list
+            self.heap = list()
+            for state in list(self.open):
+                self._push(state)
+            self.goal_heap = list()
+            for state in self.g:
+                self._consistent(state)
+        return self.plan()
+
+    def touched(self):
+        """
+        Number of states with a g or rhs value, i.e. the size of the kept search tree
+        """
+        return len(set(self.g) | set(self.rhs))
@@ -0,0 +1,36 @@
+import sys
+
+
+# Optional console output for the planners. Planners return plans and
+# Parser.iter_plans yields events; nothing is printed unless a reporter is
+# passed in, since printing whole states dominates runtime on small tasks.
+
+class ConsoleReporter(object):
+    """
+    Prints the events of Parser.iter_plans. With states=True every plan is
+    replayed through Parser.print_plan
+    """
+
+    def __init__(self, parser, states=False, out=None):
+        self.parser = parser
+        self.states = states
+        self.out = out or sys.stdout
+
+    def __call__(self, event):
+        kind = event['event']
+        if kind == 'progress':
+            print("[%.2fs] weight=%s expanded=%d generated=%d peak_frontier=%d" % (
+                event['time'], event['weight'], event['expanded'], event['generated'], event['peak_frontier']),
+                file=self.out)
+        elif kind == 'plan':
+            print("[%.2fs] plan of length %d found with weight %s" % (event['time'], event['length'],
+                                                                      event['weight']), file=self.out)
+            if self.states:
+                self.parser.print_plan(event['plan'], file=self.out)
+        elif kind == 'done':
+            if event['plan'] is None:
+                print("no solution", file=self.out)
+            else:
+                print("[%.2fs] best plan has length %d" % (event['time'], event['length']), file=self.out)
+            for action in event['plan'] or ():
+                print("  %s %s %s" % (action.name, action.agent, ' '.join(action.args)), file=self.out)
@@ -0,0 +1,599 @@
+import heapq
+from collections import deque
+from itertools import count
+
+
+# Search engines shared by parser_agents and parser_pickle.
+# They work on the bitset states built by Parser.compile and return plans
+# as lists of grounded actions. Goals are fact masks with partial-goal
+# semantics: a state satisfies goal when state & goal == goal, and facts the
+# goal does not mention may be anything.
+# Search trees keep parent links as key(new_state): (cur_state, action.index),
+# where the index is the position of the action in parser.grounded_actions;
+# states are ints, so a link costs a tuple of two references.
+
+class Stats(object):
+    """
+    Node counters collected during a search run; checked counts the candidate
+    actions tested for applicability
+    """
+
+    def __init__(self):
+        self.expanded = 0
+        self.checked = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.peak_frontier = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __str__(self):
+        return ', '.join('%s=%s' % (k, v) for k, v in self.as_dict().items())
+
+
+def bits(mask):
+    """
+    Yield the positions of the set bits of mask, lowest first
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class SuccessorGenerator(object):
+    """
+    Index of grounded actions keyed on a single precondition fact per action
+    (the least shared one). Only the buckets of facts true in a state are
+    examined, instead of every grounded action
+    """
+
+    def __init__(self, grounded_actions):
+        counts = dict()
+        for action in grounded_actions:
+            for i in bits(action.pre_mask):
+                counts[i] = counts.get(i, 0) + 1
+        self.always = list()
+        self.buckets = dict()
+        for action in grounded_actions:
+            pre = list(bits(action.pre_mask))
+            if not pre:
+                self.always.append(action)
+                continue
+            watch = min(pre, key=lambda i: counts[i])
+            self.buckets.setdefault(watch, list()).append(action)
+
+    def candidates(self, state):
+        for action in self.always:
+            yield action
+        buckets = self.buckets
+        for i in bits(state):
+            if i in buckets:
+                for action in buckets[i]:
+                    yield action
+
+
+class PredecessorGenerator(object):
+    """
+    Index of grounded actions keyed on one of their add facts, for regression.
+    An action can lead into a state only if all of its add facts are true there
+    """
+
+    def __init__(self, grounded_actions):
+        self.always = list()
+        self.buckets = dict()
+        for action in grounded_actions:
+            add = list(bits(action.add_mask))
+            if not add:
+                self.always.append(action)
+                continue
+            self.buckets.setdefault(add[0], list()).append(action)
+
+    def candidates(self, state):
+        for action in self.always:
+            yield action
+        buckets = self.buckets
+        for i in bits(state):
+            if i in buckets:
+                for action in buckets[i]:
+                    yield action
+
+
+INF = float('inf')
+
+
+def predecessors(parser, state, stats=None):
+    """
+    Yield (action, old_state) for every state old_state that action turns into state.
+    Forward, an action removes its preconditions P and adds A, so it can lead into
+    state only if A is true and P is false there; old_state is then P plus the
+    rest of state, plus any subset of A that was already true before.
+    The candidates tested are added to stats.checked
+    """
+    checked = 0
+    try:
+        for action in parser.predecessor_generator.candidates(state):
+            checked += 1
+            add = action.add_mask
+            if (state & add) != add or state & action.pre_mask:
+                continue
+            base = (state & ~add) | action.pre_mask
+            sub = add
+            while True:
+                yield action, base | sub
+                if not sub:
+                    break
+                sub = (sub - 1) & add
+    finally:
+        if stats is not None:
+            stats.checked += checked
+
+
+def successors(parser, state, stats=None):
+    """
+    Yield (action, new_state) for every grounded action applicable in state.
+    The candidates tested are added to stats.checked, also when the caller stops early
+    """
+    checked = 0
+    try:
+        for action in parser.successor_generator.candidates(state):
+            checked += 1
+            pre = action.pre_mask
+            if state & pre == pre:
+                yield action, (state & ~action.del_mask) | action.add_mask
+    finally:
+        if stats is not None:
+            stats.checked += checked
+
+
+def undo(state, action, delta):
+    """
+    Take back action on state, where delta = action.add_mask & ~old_state holds the
+    add facts it made true: the deleted preconditions come back and delta goes
+    """
+    return (state & ~delta) | action.pre_mask
+
+
+def goal_distance(state, goal):
+    """
+    Number of goal facts missing from state
+    """
+    return bin(goal & ~state).count("1")
+
+
+def _identity(state):
+    return state
+
+
+def extract_plan(parser, plan, state, key=_identity):
+    """
+    Walk the parent map (key(new_state): (cur_state, action index)) back from state
+    """
+    actions = list()
+    while plan[key(state)] is not None:
+        state, i = plan[key(state)]
+        actions.append(parser.grounded_actions[i])
+    return list(reversed(actions))
+
+
+def bfs(parser, start, goal, stats=None, key=None):
+    """
+    Breadth-first search over a deque frontier. The parent map doubles as the
+    closed set, so duplicates are dropped as soon as they are generated, and
+    the goal is tested on generation, which saves expanding the last layer.
+    States are merged on key(state) when a canonical key function is given.
+    Returns (plan, parents) where plan is a list of grounded actions or None
+    """
+    if stats is None:
+        stats = Stats()
+    if key is None:
+        key = _identity
+    parents = {key(start): None}
+    if start & goal == goal:
+        return [], parents
+    queue = deque([start])
+    stats.peak_frontier = max(stats.peak_frontier, 1)
+
+    while queue:
+        cur_state = queue.popleft()
+        stats.expanded += 1
+        for action, new_state in successors(parser, cur_state, stats):
+            stats.generated += 1
+            new_key = key(new_state)
+            if new_key in parents:
+                stats.duplicates += 1
+                continue
+            parents[new_key] = (cur_state, action.index)
+            if new_state & goal == goal:
+                return extract_plan(parser, parents, new_state, key), parents
+            queue.append(new_state)
+        stats.peak_frontier = max(stats.peak_frontier, len(queue))
+    return None, parents
+
+
+def iter_astar(parser, start, goal, h, stats=None, key=None, weight=1, bound=None, every=None):
+    """
+    Best-first search on f = g + weight * h with unit action costs, as a generator.
+    Open list entries are (f, h, tie, g, state); entries whose g is worse than
+    the best known g for their state are stale and skipped when popped.
+    Closed states are reopened when a cheaper path to them shows up.
+    States are merged on key(state) when a canonical key function is given, and
+    states with g >= bound are pruned since they cannot lead to a shorter plan.
+    Yields ('progress', stats) every `every` expansions and finally
+    ('done', plan, parents) where plan is a list of grounded actions or None
+    """
+    if stats is None:
+        stats = Stats()
+    if key is None:
+        key = _identity
+    tie = count()
+    start_key = key(start)
+    best_g = {start_key: 0}
+    parents = {start_key: None}
+    closed = set()
+    h_start = h(start)
+    open_list = [(weight * h_start, h_start, next(tie), 0, start)]
+
+    while open_list:
+        f, h_cur, _, g, cur_state = heapq.heappop(open_list)
+        cur_key = key(cur_state)
+        if g > best_g[cur_key] or cur_key in closed:
+            continue
+
+        if cur_state & goal == goal:
+            yield 'done', extract_plan(parser, parents, cur_state, key), parents
+            return
+
+        closed.add(cur_key)
+        stats.expanded += 1
+        if every and stats.expanded % every == 0:
+            yield 'progress', stats
+        for action, new_state in successors(parser, cur_state, stats):
+            stats.generated += 1
+            new_g = g + 1
+            if bound is not None and new_g >= bound:
+                continue
+            new_key = key(new_state)
+            if new_g < best_g.get(new_key, new_g + 1):
+                best_g[new_key] = new_g
+                parents[new_key] = (cur_state, action.index)
+                closed.discard(new_key)
+                h_new = h(new_state)
+                if h_new == INF:
+                    continue
+                heapq.heappush(open_list, (new_g + weight * h_new, h_new, next(tie), new_g, new_state))
+            else:
+                stats.duplicates += 1
+        stats.peak_frontier = max(stats.peak_frontier, len(open_list))
+    yield 'done', None, parents
+
+
+def astar(parser, start, goal, h, stats=None, key=None, weight=1, bound=None):
+    """
+    Run iter_astar to completion. Returns (plan, parents) where plan is a list of
+    grounded actions or None
+    """
+    for event in iter_astar(parser, start, goal, h, stats, key, weight, bound):
+        pass
+    return event[1], event[2]
+
+
+def gbfs(parser, start, goal, h, stats=None, key=None):
+    """
+    Greedy best-first search ordered by h alone (ties broken first-in first-out).
+    Duplicates are dropped and the goal is tested when states are generated;
+    states with h = INF are pruned.
+    Returns (plan, parents) where plan is a list of grounded actions or None
+    """
+    if stats is None:
+        stats = Stats()
+    if key is None:
+        key = _identity
+    tie = count()
+    parents = {key(start): None}
+    if start & goal == goal:
+        return [], parents
+    open_list = [(h(start), next(tie), start)]
+
+    while open_list:
+        h_cur, _, cur_state = heapq.heappop(open_list)
+        stats.expanded += 1
+        for action, new_state in successors(parser, cur_state, stats):
+            stats.generated += 1
+            new_key = key(new_state)
+            if new_key in parents:
+                stats.duplicates += 1
+                continue
+            parents[new_key] = (cur_state, action.index)
+            if new_state & goal == goal:
+                return extract_plan(parser, parents, new_state, key), parents
+            h_new = h(new_state)
+            if h_new != INF:
+                heapq.heappush(open_list, (h_new, next(tie), new_state))
+        stats.peak_frontier = max(stats.peak_frontier, len(open_list))
+    return None, parents
+
+
+def bidirectional(parser, start, goal, stats=None):
+    """
+    Bidirectional breadth-first search: forward from start, regression from the
+    goal read as a complete state, expanding whole layers of the smaller frontier.
+    When a layer generates states known to the other side, the meeting with the
+    shortest total depth is kept. Forward states are also tested against the
+    goal mask, and the forward side goes on alone once the backward side is
+    exhausted, so partial goals are still solved; the plan is only guaranteed to
+    be shortest when the goal is complete.
+    Returns the plan as a list of grounded actions or None
+    """
+    if stats is None:
+        stats = Stats()
+    if start & goal == goal:
+        return []
+    forward = {start: (None, 0)}
+    backward = {goal: (None, 0)}
+    f_layer = [start]
+    b_layer = [goal]
+
+    while f_layer:
+        if not b_layer or len(f_layer) <= len(b_layer):
+            seen, other, layer, expand = forward, backward, f_layer, successors
+        else:
+            seen, other, layer, expand = backward, forward, b_layer, predecessors
+        best = None
+        next_layer = list()
+        for cur_state in layer:
+            stats.expanded += 1
+            depth = seen[cur_state][1] + 1
+            for action, new_state in expand(parser, cur_state, stats):
+                stats.generated += 1
+                if new_state in seen:
+                    stats.duplicates += 1
+                    continue
+                seen[new_state] = ((cur_state, action), depth)
+                next_layer.append(new_state)
+                if new_state in other:
+                    total = depth + other[new_state][1]
+                    if best is None or total < best[0]:
+                        best = (total, new_state, True)
+                if expand is successors and new_state & goal == goal:
+                    if best is None or depth < best[0]:
+                        best = (depth, new_state, False)
+        if expand is successors:
+            f_layer = next_layer
+        else:
+            b_layer = next_layer
+        stats.peak_frontier = max(stats.peak_frontier, len(f_layer) + len(b_layer))
+
+        if best is not None:
+            total, meet, joined = best
+            plan = list()
+            state = meet
+            while forward[state][0] is not None:
+                state, action = forward[state][0]
+                plan.append(action)
+            plan.reverse()
+            state = meet
+            while joined and backward[state][0] is not None:
+                state, action = backward[state][0]
+                plan.append(action)
+            return plan
+    return None
+
+
+def idastar(parser, start, goal, h, stats=None, key=None):
+    """
+    Iterative-deepening A*: depth-first searches bounded by f = g + h, raising the
+    bound to the smallest f that exceeded it. A single state is moved along the
+    path by applying actions and undoing them on backtrack, so only (action, delta)
+    pairs are kept per depth and memory grows with the plan length; states already
+    on the path are skipped.
+    Returns the plan as a list of grounded actions or None
+    """
+    if stats is None:
+        stats = Stats()
+    if key is None:
+        key = _identity
+    if start & goal == goal:
+        return []
+    candidates = parser.successor_generator.candidates
+    bound = h(start)
+    while bound != INF:
+        next_bound = INF
+        state = start
+        path = list()
+        on_path = {key(start)}
+        stack = [candidates(start)]
+        stats.expanded += 1
+        while stack:
+            for action in stack[-1]:
+                stats.checked += 1
+                pre = action.pre_mask
+                if state & pre != pre:
+                    continue
+                stats.generated += 1
+                # apply in place; delta is all that undo needs
+                delta = action.add_mask & ~state
+                new_state = (state & ~pre) | delta
+                new_key = key(new_state)
+                if new_key in on_path:
+                    stats.duplicates += 1
+                    continue
+                f = len(path) + 1 + h(new_state)
+                if f > bound:
+                    next_bound = min(next_bound, f)
+                    continue
+                if new_state & goal == goal:
+                    return [a for a, _ in path] + [action]
+                path.append((action, delta))
+                on_path.add(new_key)
+                state = new_state
+                stack.append(candidates(state))
+                stats.expanded += 1
+                break
+            else:
+                stack.pop()
+                on_path.discard(key(state))
+                if path:
+                    action, delta = path.pop()
+                    state = undo(state, action, delta)
+            stats.peak_frontier = max(stats.peak_frontier, len(stack))
+        bound = next_bound
+    return None
+
+
+class _Node(object):
+    """
+    Search node of smastar. forgotten maps the keys of pruned children to their
+    backed-up f until they are regrown, queued is the priority of the node's
+    current open list entry
+    """
+    __slots__ = ('state', 'key', 'g', 'f', 'parent', 'action', 'children', 'forgotten', 'queued', 'alive')
+
+    def __init__(self, state, key, g, f, parent, action):
+        self.state = state
+        self.key = key
+        self.g = g
+        self.f = f
+        self.parent = parent
+        self.action = action
+        self.children = 0
+        self.forgotten = None
+        self.queued = None
+        self.alive = True
+
+
+def smastar(parser, start, goal, h, stats=None, key=None, max_nodes=100000):
+    """
+    Memory-bounded A* in the style of SMA*: at most max_nodes nodes are kept once
+    an expansion is done. While the limit is exceeded, the shallowest open leaf
+    with the worst f is forgotten (never the best child of the node just
+    expanded) and its f is backed up into its parent, which is queued again with
+    the smallest f of its forgotten children to regrow them later. A regrown
+    child gets back its backed-up f, so what pruning learned is not lost, and
+    f values are made monotone along paths (pathmax). A state reached by a
+    cheaper path than its copy in memory is generated again, the two copies are
+    forgotten independently. Paths are limited to max_nodes nodes: children
+    that could not reach a goal within that depth are not generated.
+    Returns the plan as a list of grounded actions, or None if there is none or no
+    plan fits into max_nodes
+    """
+    if stats is None:
+        stats = Stats()
+    if key is None:
+        key = _identity
+    tie = count()
+    root = _Node(start, key(start), 0, h(start), None, None)
+    # best known node of every key in memory, and the count of all nodes in memory
+    nodes = {root.key: root}
+    size = 1
+    open_list = list()
+    worst = list()
+
+    def push(node, priority):
+        node.queued = priority
+        heapq.heappush(open_list, (priority, -node.g, next(tie), node))
+        if node.children == 0:
+            heapq.heappush(worst, (-priority, node.g, next(tie), node))
+
+    def detach(node):
+        # node leaves memory; its parent keeps its f and is queued to regrow it
+        nonlocal size
+        size -= 1
+        if nodes.get(node.key) is node:
+            del nodes[node.key]
+        node.alive = False
+        parent = node.parent
+        parent.children -= 1
+        if parent.forgotten is None:
+            parent.forgotten = dict()
+        parent.forgotten[node.key] = node.f
+        regrow = min(parent.forgotten.values())
+        if parent.children == 0:
+            parent.f = max(parent.f, regrow)
+        push(parent, regrow)
+
+    def forget(keep):
+        skipped = list()
+        pruned = False
+        while worst:
+            entry = heapq.heappop(worst)
+            node = entry[3]
+            if not node.alive or node.children or node.queued != -entry[0] or node is root:
+                continue
+            if node is keep:
+                skipped.append(entry)
+                continue
+            detach(node)
+            pruned = True
+            break
+        for entry in skipped:
+            heapq.heappush(worst, entry)
+        return pruned
+
+    push(root, root.f)
+    while open_list:
+        f, _, _, node = heapq.heappop(open_list)
+        if not node.alive or f != node.queued:
+            continue
+        if f == INF:
+            break
+        node.queued = None
+        if node.state & goal == goal:
+            plan = list()
+            while node.parent is not None:
+                plan.append(node.action)
+                node = node.parent
+            plan.reverse()
+            return plan
+
+        stats.expanded += 1
+        backed_up = node.forgotten or dict()
+        node.forgotten = None
+        # a node queued to regrow pruned children may still have others in memory
+        kept = node.children
+        best = None
+        new_g = node.g + 1
+        for action, new_state in successors(parser, node.state, stats):
+            stats.generated += 1
+            is_goal = new_state & goal == goal
+            if new_g + (1 if is_goal else 2) > max_nodes:
+                # the path through this child does not fit into max_nodes
+                continue
+            new_key = key(new_state)
+            old = nodes.get(new_key)
+            if old is not None:
+                if old.g <= new_g:
+                    stats.duplicates += 1
+                    continue
+                # cheaper path: the old copy stays in memory with what was learned below
+                # it, and is forgotten like any other node
+            h_new = h(new_state)
+            if h_new == INF:
+                continue
+            child_f = max(f, new_g + h_new, backed_up.get(new_key, 0))
+            child = _Node(new_state, new_key, new_g, child_f, node, action)
+            nodes[new_key] = child
+            size += 1
+            node.children += 1
+            push(child, child_f)
+            if best is None or (child_f, -new_g) < (best.f, -best.g):
+                best = child
+        if node.children == 0:
+            # dead end, or every successor is held on a path at least as short
+            node.f = INF
+            push(node, INF)
+        elif best is not None:
+            # back up the best child, forgetting node later passes this f on
+            node.f = min(node.f, best.f) if kept else best.f
+        while size > max_nodes:
+            if not forget(best):
+                return None
+        stats.peak_frontier = max(stats.peak_frontier, size)
+        if len(open_list) > 4 * size + 64:
+            # drop entries of forgotten, expanded or requeued nodes
+            open_list[:] = [e for e in open_list if e[3].alive and e[3].queued == e[0]]
+            heapq.heapify(open_list)
+            worst[:] = [e for e in worst if e[3].alive and not e[3].children and e[3].queued == -e[0]]
+            heapq.heapify(worst)
+    return None
@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import batch
+import task_cache
+
+
+# Asynchronous planning service: requests carry the domain and problem JSON as
+# dicts, nothing is read from or written to the working directory. Searches run
+# on a process pool. Identical requests (same canonical domain, problem and
+# planner options) that arrive while one is being solved wait for that one
+# search, and finished results are kept in an LRU cache bounded by their JSON
+# size.
+#
+#   async with PlanningService(workers=4) as service:
+#       result = await service.solve(dom_input, prob_input, planner='astar', deadline=2.0)
+#
+#   with PlanningClient(in_process=True) as client:      # blocking, for scripts and tests
+#       result = client.solve('domain.json', 'task01.json')
+#
+#   python service.py task01.json task01.json --repeat 4 --deadline 5
+
+_domains = OrderedDict()
+
+
+def request_key(parser_module, dom_input, prob_input, planner='astar', heuristic='goal_count', max_nodes=100000):
+    """
+    Hash of a request: the canonical task hash of task_cache plus the planner options
+    """
+    task = task_cache.task_key(parser_module, dom_input, prob_input)
+    data = json.dumps([task, planner, heuristic, max_nodes if planner == 'smastar' else None])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _init_worker(memory_mb=None):
+    """
+    Pool initializer: memory cap and the SIGALRM handler for per-task time limits
+    """
+    if memory_mb:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGALRM, batch._on_alarm)
+
+
+def _parsed_domain(module, dom_input, keep=8):
+    """
+    Parsed domain of this worker for dom_input, reused across requests
+    """
+    key = (module.__name__, json.dumps(dom_input, sort_keys=True))
+    domain = _domains.get(key)
+    if domain is None:
+        domain = module.parse_domain_def(dom_input)
+        _domains[key] = domain
+        if len(_domains) > keep:
+            _domains.popitem(last=False)
+    else:
+        _domains.move_to_end(key)
+    return domain
+
+
+def solve_inputs(parser_module, dom_input, prob_input, planner='astar', heuristic='goal_count', max_nodes=100000,
+                 time_limit=None):
+    """
+    Worker side of PlanningService: plan for domain and problem dicts. Returns the
+    result dict of batch.solve_parser. The time limit is only applied in the main
+    thread of a pool process, where SIGALRM can be handled
+    """
+    module = importlib.import_module(parser_module)
+    parser = module.Parser(None, None)
+    parser.domInput = dom_input
+    try:
+        parser.domain = _parsed_domain(module, dom_input)
+    except Exception as e:
+        # a malformed domain is reported like a malformed problem in solve_parser
+        return {'planner': planner, 'status': 'error', 'error': '%s: %s' % (type(e).__name__, e), 'stats': None}
+    parser.probInput = prob_input
+    if threading.current_thread() is not threading.main_thread():
+        time_limit = None
+    return batch.solve_parser(parser, planner, heuristic, time_limit, max_nodes)
+
+
+class ResultCache(object):
+    """
+    LRU map of request keys to result dicts. Once the JSON size of the stored
+    results exceeds max_bytes, the least recently used ones are evicted
+    """
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, result):
+        size = len(json.dumps(result))
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (result, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.size -= old_size
+
+
+class PlanningService(object):
+    """
+    Plans on a process pool (a single worker thread with in_process=True, which
+    ignores time_limit). time_limit caps each search in seconds, memory_mb the
+    address space of each pool process
+    """
+
+    def __init__(self, parser_module='parser_pickle', workers=None, cache_bytes=64 << 20, time_limit=None,
+                 memory_mb=None, in_process=False):
+        self.parser_module = parser_module
+        self.workers = workers
+        self.time_limit = time_limit
+        self.memory_mb = memory_mb
+        self.in_process = in_process
+        self.cache = ResultCache(cache_bytes)
+        self.inflight = dict()
+        self.counters = dict((name, 0) for name in ('requests', 'cache_hits', 'coalesced', 'searches', 'deadlines'))
+        self.executor = None
+
+    def start(self):
+        if self.executor is None:
+            if self.in_process:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            else:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                    initargs=(self.memory_mb,))
+        return self
+
+    def close(self):
+        """
+        Drop queued searches and wait for the running ones
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    async def aclose(self):
+        """
+        Cancel the searches still in flight (callers still waiting for one get
+        CancelledError), wait for them and close the pool without blocking the
+        event loop
+        """
+        tasks = list(self.inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def solve(self, dom_input, prob_input, planner='astar', heuristic='goal_count', max_nodes=100000,
+                    deadline=None):
+        """
+        Plan for the domain and problem dicts. Returns a result dict with status
+        'solved', 'unsolvable', 'timeout', 'memory', 'error' or 'crashed' as in
+        batch.py, marked 'cached' when it comes from the cache, or status 'deadline'
+        when no result arrived within deadline seconds. A search outlives the
+        deadlines of its callers, so its result still lands in the cache
+        """
+        self.counters['requests'] += 1
+        key = request_key(self.parser_module, dom_input, prob_input, planner, heuristic, max_nodes)
+        result = self.cache.get(key)
+        if result is not None:
+            self.counters['cache_hits'] += 1
+            return dict(result, cached=True)
+        future = self.inflight.get(key)
+        if future is None:
+            args = (self.parser_module, dom_input, prob_input, planner, heuristic, max_nodes, self.time_limit)
+            future = asyncio.ensure_future(self._search(key, args))
+            self.inflight[key] = future
+        else:
+            self.counters['coalesced'] += 1
+        try:
+            # shielded: one caller giving up must not cancel the others' search
+            result = await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            self.counters['deadlines'] += 1
+            return {'planner': planner, 'status': 'deadline'}
+        return dict(result)
+
+    async def _search(self, key, args):
+        self.start()
+        self.counters['searches'] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, solve_inputs, *args)
+        except BrokenProcessPool:
+            result = {'planner': args[3], 'status': 'crashed'}
+            self.executor = None
+        finally:
+            del self.inflight[key]
+        if result['status'] in ('solved', 'unsolvable'):
+            self.cache.put(key, result)
+        return result
+
+
+def _load(source):
+    if isinstance(source, dict):
+        return source
+    with open(source, 'rb') as f:
+        return json.loads(f.read())
+
+
+class PlanningClient(object):
+    """
+    Blocking client that runs a PlanningService on an event loop in a background
+    thread. Domains and problems are dicts or JSON file names
+    """
+
+    def __init__(self, **kwargs):
+        self.service = PlanningService(**kwargs).start()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def solve(self, domain, problem, **kwargs):
+        return self._run(self.service.solve(_load(domain), _load(problem), **kwargs))
+
+    def solve_many(self, domain, problems, **kwargs):
+        """
+        Submit all problems at once and return their results in order
+        """
+        dom_input = _load(domain)
+
+        async def gather():
+            return await asyncio.gather(*[self.service.solve(dom_input, _load(p), **kwargs) for p in problems])
+        return self._run(gather())
+
+    def close(self):
+        self._run(self.service.aclose())
+        self._run(self.loop.shutdown_default_executor())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Send problems to the planning service concurrently")
+    ap.add_argument('problems', nargs='+', help="problem JSON files")
+    ap.add_argument('--domain', default='domain.json')
+    ap.add_argument('--parser', default='parser_pickle', choices=['parser_pickle', 'parser_agents'])
+    ap.add_argument('--planner', default='astar', choices=batch.PLANNERS)
+    ap.add_argument('--heuristic', default='goal_count')
+    ap.add_argument('--repeat', type=int, default=1, help="send every problem this many times")
+    ap.add_argument('--deadline', type=float, help="seconds a request waits for its result")
+    ap.add_argument('--time-limit', type=float, help="seconds per search")
+    ap.add_argument('--workers', type=int, help="worker processes (all cores by default)")
+    ap.add_argument('--in-process', action='store_true', help="search in a thread of this process")
+    args = ap.parse_args(argv)
+
+    problems = [p for p in args.problems for _ in range(args.repeat)]
+    start = time.perf_counter()
+    with PlanningClient(parser_module=args.parser, workers=args.workers, time_limit=args.time_limit,
+                        in_process=args.in_process) as client:
+        results = client.solve_many(args.domain, problems, planner=args.planner, heuristic=args.heuristic,
+                                    deadline=args.deadline)
+        # a second round is answered from the cache
+        results += client.solve_many(args.domain, args.problems, planner=args.planner, heuristic=args.heuristic)
+        counters = dict(client.service.counters)
+    for prob_file, result in zip(problems + args.problems, results):
+        print(json.dumps(dict([('problem', prob_file)] + [kv for kv in result.items() if kv[0] != 'plan'])))
+    print(counters, "%.3fs" % (time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+from itertools import permutations
+from itertools import product
+
+
+# Symmetry reduction for the lab03 parsers.
+# Objects are interchangeable when they have the same type, every agent can
+# handle them equally, and swapping them leaves the goal unchanged. States that
+# only differ by such a permutation are merged into one search node through a
+# canonical key, which is computed once per state and cached.
+
+def _swap(fact, a, b):
+    return fact[:1] + tuple(b if x == a else a if x == b else x for x in fact[1:])
+
+
+def object_classes(parser):
+    """
+    Group problem objects into classes of interchangeable objects
+    """
+    goal = set(parser.decode_state(parser.goal_state))
+    agents = [x.name for x in parser.domain.agents]
+    classes = list()
+    for ob in parser.problem.object_types:
+        for cls in classes:
+            rep = cls[0]
+            if parser.problem.object_types[rep] != parser.problem.object_types[ob]:
+                continue
+            if any(parser.capacity.get((ag, rep)) != parser.capacity.get((ag, ob)) for ag in agents):
+                continue
+            if set(_swap(fact, rep, ob) for fact in goal) != goal:
+                continue
+            cls.append(ob)
+            break
+        else:
+            classes.append([ob])
+    return [cls for cls in classes if len(cls) > 1]
+
+
+def merge_equivalent_actions(grounded_actions):
+    """
+    Keep one grounded action per distinct (pre, add, del) mask triple. Agents with
+    the same capacity produce identical transitions on agent-free states, so only
+    the first of them is kept
+    """
+    seen = set()
+    kept = list()
+    for action in grounded_actions:
+        masks = (action.pre_mask, action.add_mask, action.del_mask)
+        if masks not in seen:
+            seen.add(masks)
+            kept.append(action)
+    return kept
+
+
+class Canonicalizer(object):
+    """
+    Maps a bitset state to the smallest state reachable by permuting interchangeable
+    objects. The permutation group is capped at max_perms elements by leaving the
+    largest classes out, so the key stays cheap to compute
+    """
+
+    def __init__(self, parser, max_perms=720):
+        classes = sorted(object_classes(parser), key=len)
+        group = list()
+        size = 1
+        for cls in classes:
+            n = 1
+            for i in range(2, len(cls) + 1):
+                n *= i
+            if size * n > max_perms:
+                break
+            size *= n
+            group.append([dict(zip(cls, perm)) for perm in permutations(cls)])
+        self.classes = [list(maps[0]) for maps in group]
+
+        facts = list(parser.facts)
+        self.perms = list()
+        for maps in product(*group):
+            mapping = dict()
+            for m in maps:
+                mapping.update(m)
+            if all(k == v for k, v in mapping.items()):
+                continue
+            self.perms.append([parser.fact_id(fact[:1] + tuple(mapping.get(x, x) for x in fact[1:]))
+                               for fact in facts])
+        self.cache = dict()
+
+    def __call__(self, state):
+        key = self.cache.get(state)
+        if key is None:
+            key = state
+            for perm in self.perms:
+                permuted = 0
+                rest = state
+                while rest:
+                    low = rest & -rest
+                    permuted |= 1 << perm[low.bit_length() - 1]
+                    rest ^= low
+                if permuted < key:
+                    key = permuted
+            self.cache[state] = key
+        return key
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from search import bits
+
+
+# Compiled task cache: the grounded, integer-encoded task of a parser is written
+# to a binary file named after a hash of the domain and problem JSON, so that a
+# later run can skip grounding. The file is a fixed header, a JSON string table
+# (facts and action names) and then the bit masks as fixed-width little-endian
+# blocks, which are read straight out of a memory map:
+#
+#   header | strings | init | goal | pre_0 | add_0 | pre_1 | add_1 | ...
+#
+# Actions delete their preconditions, so del masks are not stored.
+
+MAGIC = b'PLTC'
+VERSION = 1
+HEADER = struct.Struct('<4sHIII')
+
+
+def task_key(variant, dom_input, prob_input, symmetry=False):
+    """
+    Hash of everything the compiled task depends on, the parser variant
+    (BaseParser.variant) included since the lab03 parsers disagree on agent
+    feasibility
+    """
+    data = json.dumps([VERSION, variant, bool(symmetry), dom_input, prob_input], sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def task_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.task')
+
+
+class CompiledAction(object):
+    """
+    A grounded action restored from the cache, with the same fields as a
+    compiled _GroundedAction
+    """
+    __slots__ = ('name', 'agent', 'args', 'precondition', 'effects', 'pre_mask', 'del_mask', 'add_mask', 'index')
+
+    def __init__(self, name, agent, args, pre_mask, add_mask):
+        self.name = name
+        self.agent = agent
+        self.args = args
+        self.precondition = tuple(bits(pre_mask))
+        self.effects = tuple(bits(add_mask))
+        self.pre_mask = pre_mask
+        self.del_mask = pre_mask
+        self.add_mask = add_mask
+
+    def __str__(self):
+        return '(%s %s %s)' % (self.name, self.agent, ' '.join(self.args))
+
+
+def save_task(parser, path):
+    """
+    Write the compiled task of parser to path. The file is replaced atomically, so
+    concurrent workers never read a half-written task
+    """
+    width = (len(parser.facts) + 7) // 8 or 1
+    strings = json.dumps({
+        'facts': parser.facts,
+        'actions': [[a.name, a.agent, list(a.args)] for a in parser.grounded_actions],
+    }).encode('utf-8')
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(parser.facts), len(parser.grounded_actions), len(strings)))
+        f.write(strings)
+        f.write(parser.init_state.to_bytes(width, 'little'))
+        f.write(parser.goal_state.to_bytes(width, 'little'))
+        for a in parser.grounded_actions:
+            f.write(a.pre_mask.to_bytes(width, 'little'))
+            f.write(a.add_mask.to_bytes(width, 'little'))
+    os.replace(tmp, path)
+
+
+def load_task(parser, path):
+    """
+    Restore facts, initial and goal state and grounded actions from path into
+    parser. Returns False if there is no usable cache file
+    """
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return False
+    with f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            # empty or cut short before the header, mmap refuses empty files
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, n_facts, n_actions, n_strings = HEADER.unpack_from(mm, 0)
+            width = (n_facts + 7) // 8 or 1
+            offset = HEADER.size + n_strings
+            if magic != MAGIC or version != VERSION or len(mm) != offset + (2 + 2 * n_actions) * width:
+                return False
+
+            def mask(i):
+                start = offset + i * width
+                return int.from_bytes(mm[start:start + width], 'little')
+
+            try:
+                strings = json.loads(mm[HEADER.size:offset].decode('utf-8'))
+                facts = [tuple(fact) for fact in strings['facts']]
+                actions = [CompiledAction(name, agent, tuple(args), mask(2 + 2 * i), mask(3 + 2 * i))
+                           for i, (name, agent, args) in enumerate(strings['actions'])]
+            except (ValueError, KeyError, TypeError):
+                # corrupt string table, the caller grounds the task again
+                return False
+            if len(facts) != n_facts or len(actions) != n_actions:
+                return False
+            parser.facts = facts
+            parser.fact_ids = dict((fact, i) for i, fact in enumerate(facts))
+            parser.init_state = mask(0)
+            parser.goal_state = mask(1)
+            parser.grounded_actions = actions
+    return True
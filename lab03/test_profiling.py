@@ -0,0 +1,38 @@
+import os
+import tracemalloc
+import unittest
+
+import parser_pickle
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOMAIN = os.path.join(HERE, 'domain.json')
+TASK = os.path.join(HERE, 'task01.json')
+
+
+class ProfileTest(unittest.TestCase):
+    def profiled(self):
+        parser = parser_pickle.Parser(DOMAIN, TASK)
+        profile = parser.enable_profiling(memory=True)
+        parser.parse_domain()
+        parser.parse_problem()
+        self.assertIsNotNone(parser.astar_planner())
+        return profile
+
+    def test_memory_phases_stop_tracing(self):
+        self.assertFalse(tracemalloc.is_tracing())
+        profile = self.profiled()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIn('astar', profile.peak_kb)
+        self.assertGreater(profile.counters['expanded'], 0)
+
+    def test_tracing_started_elsewhere_is_left_on(self):
+        tracemalloc.start()
+        try:
+            self.profiled()
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
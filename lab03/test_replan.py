@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import benchmark
+import parser_pickle
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOMAIN = os.path.join(HERE, 'domain.json')
+
+
+class LifelongPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, problem, name):
+        path = os.path.join(self.tmp, name + '.json')
+        with open(path, 'w') as f:
+            json.dump(problem, f)
+        return path
+
+    def parser(self, path):
+        parser = parser_pickle.Parser(DOMAIN, path)
+        parser.parse_domain()
+        parser.parse_problem()
+        return parser
+
+    def test_update_reuses_the_search_tree(self):
+        first = benchmark.random_blocks_problem(5, 0)
+        # the same task with a new goal, as when a plan is replaced during execution
+        second = dict(first, goal=benchmark.random_blocks_problem(5, 1)['goal'])
+        first_path = self.write(first, 'first')
+        second_path = self.write(second, 'second')
+
+        parser = self.parser(first_path)
+        self.assertEqual(len(parser.incremental_planner()), len(self.parser(first_path).bfs_planner()))
+        kept = parser.replanner.touched()
+        self.assertGreater(kept, 0)
+
+        plan = parser.incremental_planner(second_path)
+        self.assertEqual(len(plan), len(self.parser(second_path).bfs_planner()))
+        # the tree of the first search is still there and grows only by the repair
+        self.assertGreaterEqual(parser.replanner.touched(), kept)
+        repaired = parser.stats.expanded
+
+        fresh = self.parser(second_path)
+        self.assertEqual(len(fresh.incremental_planner()), len(plan))
+        self.assertLess(repaired, fresh.stats.expanded)
+
+
+if __name__ == "__main__":
+    unittest.main()
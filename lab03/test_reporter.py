@@ -0,0 +1,30 @@
+import contextlib
+import io
+import os
+import unittest
+
+import parser_pickle
+from reporter import ConsoleReporter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOMAIN = os.path.join(HERE, 'domain.json')
+TASK = os.path.join(HERE, 'task01.json')
+
+
+class ConsoleReporterTest(unittest.TestCase):
+    def test_states_go_to_the_reporter_stream(self):
+        parser = parser_pickle.Parser(DOMAIN, TASK)
+        parser.parse_domain()
+        parser.parse_problem()
+        out = io.StringIO()
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            for event in parser.iter_plans(weights=(1,)):
+                ConsoleReporter(parser, states=True, out=out)(event)
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn("best plan has length", out.getvalue())
+        self.assertIn("STATE - ", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import benchmark
+import parser_agents
+import parser_pickle
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOMAIN = os.path.join(HERE, 'domain.json')
+
+
+class SMAStarTest(unittest.TestCase):
+    """
+    smastar with an admissible heuristic must stay optimal and terminate when
+    max_nodes leaves little room beyond the solution path
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def parser(self, n, seed, module=parser_pickle):
+        problem = benchmark.random_blocks_problem(n, seed)
+        path = os.path.join(self.tmp, problem["name"] + '.json')
+        with open(path, 'w') as f:
+            json.dump(problem, f)
+        parser = module.Parser(DOMAIN, path)
+        parser.parse_domain()
+        parser.parse_problem()
+        return parser
+
+    def check(self, n, seed, max_nodes, heuristic='h_max'):
+        parser = self.parser(n, seed)
+        optimal = parser.bfs_planner()
+        plan = parser.smastar_planner(max_nodes, heuristic=heuristic)
+        self.assertIsNotNone(plan)
+        self.assertLessEqual(parser.stats.peak_frontier, max_nodes)
+        state = parser.init_state
+        for action in plan:
+            self.assertTrue(parser.gettable(state, action))
+            state = parser.get_state(state, action)
+        self.assertEqual(state & parser.goal_state, parser.goal_state)
+        if heuristic == 'h_max':
+            self.assertEqual(len(plan), len(optimal))
+        return plan
+
+    def test_optimal_with_small_memory(self):
+        for seed in range(4):
+            self.check(4, seed, 16)
+        self.check(5, 0, 20)
+        self.check(5, 2, 40)
+
+    def test_cheaper_path_to_an_expanded_node(self):
+        # regression: with 12 nodes an interior node is reached again on a shorter path
+        parser = self.parser(4, 3, parser_agents)
+        optimal = parser.bfs_planner()
+        self.assertEqual(len(parser.smastar_planner(12, heuristic='h_max')), len(optimal))
+
+    def test_terminates_with_weak_heuristic(self):
+        self.check(6, 0, 20, heuristic='goal_count')
+
+    def test_no_plan_fits(self):
+        parser = self.parser(4, 0)
+        optimal = parser.bfs_planner()
+        self.assertIsNone(parser.smastar_planner(len(optimal), heuristic='h_max'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import gc
+import json
+import logging
+import os
+import unittest
+
+import benchmark
+from service import PlanningClient
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOMAIN = os.path.join(HERE, 'domain.json')
+TASK = os.path.join(HERE, 'task01.json')
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.records = list()
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class PlanningClientTest(unittest.TestCase):
+    def setUp(self):
+        self.client = PlanningClient(in_process=True)
+
+    def tearDown(self):
+        if self.client is not None:
+            self.client.close()
+
+    def test_identical_requests_share_one_search(self):
+        results = self.client.solve_many(DOMAIN, [TASK, TASK, TASK])
+        self.assertEqual([r['status'] for r in results], ['solved'] * 3)
+        self.assertEqual(results[0]['plan'], results[1]['plan'])
+        self.assertEqual(results[0]['plan'], results[2]['plan'])
+        counters = self.client.service.counters
+        self.assertEqual(counters['searches'], 1)
+        self.assertEqual(counters['coalesced'], 2)
+
+    def test_repeated_request_is_answered_from_the_cache(self):
+        first = self.client.solve(DOMAIN, TASK)
+        second = self.client.solve(DOMAIN, TASK)
+        self.assertNotIn('cached', first)
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['plan'], second['plan'])
+        self.assertEqual(self.client.service.counters['searches'], 1)
+        self.assertEqual(self.client.service.counters['cache_hits'], 1)
+
+    def test_planner_options_are_part_of_the_key(self):
+        self.client.solve(DOMAIN, TASK, planner='astar')
+        result = self.client.solve(DOMAIN, TASK, planner='bfs')
+        self.assertNotIn('cached', result)
+        self.assertEqual(self.client.service.counters['searches'], 2)
+
+    def test_search_outlives_a_missed_deadline(self):
+        problem = benchmark.random_blocks_problem(6, 0)
+        late = self.client.solve(DOMAIN, problem, planner='bfs', deadline=0.001)
+        self.assertEqual(late['status'], 'deadline')
+        self.assertEqual(self.client.service.counters['deadlines'], 1)
+        # the search keeps running: a second caller waits for it instead of starting another
+        result = self.client.solve(DOMAIN, problem, planner='bfs')
+        self.assertEqual(result['status'], 'solved')
+        self.assertEqual(self.client.service.counters['searches'], 1)
+        self.assertEqual(self.client.service.counters['coalesced'], 1)
+
+    def test_close_cancels_pending_searches(self):
+        problem = benchmark.random_blocks_problem(6, 1)
+        result = self.client.solve(DOMAIN, problem, planner='bfs', deadline=0.001)
+        self.assertEqual(result['status'], 'deadline')
+        service = self.client.service
+        self.assertEqual(len(service.inflight), 1)
+        handler = _Records()
+        logger = logging.getLogger('asyncio')
+        logger.addHandler(handler)
+        try:
+            self.client.close()
+            self.client = None
+            gc.collect()
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(service.inflight, {})
+        self.assertIsNone(service.executor)
+        self.assertEqual([r.getMessage() for r in handler.records], [])
+
+    def test_bad_problem_is_reported_not_raised(self):
+        with open(TASK) as f:
+            problem = json.load(f)
+        problem['goal'] = {'on': [['D', 'nowhere']]}
+        result = self.client.solve(DOMAIN, problem)
+        self.assertIn(result['status'], ('error', 'unsolvable'))
+
+    def test_bad_domain_is_reported_not_raised(self):
+        results = self.client.solve_many({'domain': 'x', 'action': {'a': {}}}, [TASK, TASK])
+        self.assertEqual([r['status'] for r in results], ['error', 'error'])
+        self.assertIn('KeyError', results[0]['error'])
+        self.assertEqual(self.client.service.counters['searches'], 1)
+        self.assertEqual(self.client.service.counters['coalesced'], 1)
+        # errors are not cached
+        self.assertNotIn('cached', self.client.solve({'domain': 'x', 'action': {'a': {}}}, TASK))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import parser_pickle
+import task_cache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOMAIN = os.path.join(HERE, 'domain.json')
+TASK = os.path.join(HERE, 'task01.json')
+
+
+class TaskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def parser(self):
+        parser = parser_pickle.Parser(DOMAIN, TASK)
+        parser.task_cache = self.tmp
+        parser.parse_domain()
+        return parser
+
+    def path(self, parser):
+        key = task_cache.task_key(parser.variant, parser.domInput, parser.probInput, parser.symmetry)
+        return task_cache.task_path(self.tmp, key)
+
+    def test_cached_task_matches_grounding(self):
+        first = self.parser()
+        first.parse_problem()
+        second = self.parser()
+        self.assertTrue(task_cache.load_task(second, self.path(first)))
+        self.assertEqual(second.facts, first.facts)
+        self.assertEqual([str(a) for a in second.grounded_actions], [str(a) for a in first.grounded_actions])
+        self.assertEqual(second.init_state, first.init_state)
+
+    def check_falls_back(self, damage):
+        first = self.parser()
+        first.parse_problem()
+        path = self.path(first)
+        with open(path, 'r+b') as f:
+            damage(f)
+        self.assertFalse(task_cache.load_task(self.parser(), path))
+        # parse_problem grounds again and replaces the damaged file
+        parser = self.parser()
+        parser.parse_problem()
+        self.assertEqual(len(parser.grounded_actions), len(first.grounded_actions))
+        self.assertEqual([str(a) for a in parser.astar_planner()], [str(a) for a in first.astar_planner()])
+        self.assertTrue(task_cache.load_task(self.parser(), path))
+
+    def test_empty_file(self):
+        self.check_falls_back(lambda f: f.truncate(0))
+
+    def test_truncated_header(self):
+        self.check_falls_back(lambda f: f.truncate(task_cache.HEADER.size - 1))
+
+    def test_corrupt_string_table(self):
+        def damage(f):
+            f.seek(task_cache.HEADER.size + 5)
+            f.write(b'\xff\xff')
+        self.check_falls_back(damage)
+
+    def test_string_table_of_the_wrong_shape(self):
+        def damage(f):
+            f.seek(task_cache.HEADER.size)
+            f.write(b'[1')
+        self.check_falls_back(damage)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+from search import Stats
+from search import _identity
+from search import extract_plan
+
+
+# NumPy expansion backend for the lab03 parsers, bfs_planner(backend='numpy').
+# The pre/add masks of all grounded actions are packed into uint64 word
+# matrices (actions delete their preconditions, so there is no separate delete
+# matrix). A whole BFS layer is packed the same way and tested against every
+# action at once, the children are computed as (state & ~pre) | add rows, and
+# the goal count of all children is taken in one popcount. Python ints are only
+# rebuilt for the distinct children of a layer, for the parent map.
+#
+# numpy is optional and only imported when a VectorTask is built, so parsers
+# using the pure-Python path do not pay for importing it.
+
+np = None
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("the numpy backend needs numpy")
+        np = numpy
+    return np
+
+
+def _popcount(words):
+    """
+    Set bits per row of a uint64 matrix
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+
+class VectorTask(object):
+    """
+    Precondition and add matrices of a compiled task, one row of little-endian
+    uint64 words per grounded action (in grounded_actions order, i.e. by index)
+    """
+
+    def __init__(self, parser):
+        _load_numpy()
+        self.words = (len(parser.facts) + 63) // 64 or 1
+        self.nbytes = 8 * self.words
+        actions = parser.grounded_actions
+        self.pre = self.pack([a.pre_mask for a in actions])
+        self.add = self.pack([a.add_mask for a in actions])
+        self.goal = self.pack([parser.goal_state])[0]
+
+    def pack(self, states):
+        data = b''.join(s.to_bytes(self.nbytes, 'little') for s in states)
+        return np.frombuffer(data, dtype='<u8').reshape(len(states), self.words)
+
+    def unpack(self, rows):
+        data = np.ascontiguousarray(rows, dtype='<u8').tobytes()
+        n = self.nbytes
+        return [int.from_bytes(data[i:i + n], 'little') for i in range(0, len(data), n)]
+
+    def applicable(self, states, chunk=1 << 22):
+        """
+        (rows, actions) index arrays of every applicable pair of a packed state
+        and an action. The state x action matrix is built chunk cells at a time
+        """
+        n_actions = len(self.pre)
+        step = max(1, chunk // max(1, n_actions))
+        rows = list()
+        acts = list()
+        for start in range(0, len(states), step):
+            block = states[start:start + step]
+            ok = np.ones((len(block), n_actions), dtype=bool)
+            for w in range(self.words):
+                pre = self.pre[:, w]
+                ok &= (block[:, w, None] & pre) == pre
+            r, a = np.nonzero(ok)
+            rows.append(r + start)
+            acts.append(a)
+        if not rows:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        return np.concatenate(rows), np.concatenate(acts)
+
+    def successors(self, states):
+        """
+        (rows, actions, children) for a packed layer: children[i] is action
+        actions[i] applied to states[rows[i]]
+        """
+        rows, acts = self.applicable(states)
+        children = (states[rows] & ~self.pre[acts]) | self.add[acts]
+        return rows, acts, children
+
+    def goal_count(self, states):
+        """
+        Number of goal facts missing from each packed state, as heuristics.GoalCount
+        """
+        return _popcount(self.goal & ~states)
+
+
+def bfs(parser, start, goal, stats=None, key=None, task=None):
+    """
+    Layered breadth-first search expanding each layer with one batch of matrix
+    operations. Plans have the same length as search.bfs.
+    Returns (plan, parents) like search.bfs
+    """
+    if stats is None:
+        stats = Stats()
+    if key is None:
+        key = _identity
+    if task is None:
+        task = VectorTask(parser)
+    parents = {key(start): None}
+    if start & goal == goal:
+        return [], parents
+    layer = [start]
+    stats.peak_frontier = max(stats.peak_frontier, 1)
+
+    while layer:
+        stats.expanded += len(layer)
+        stats.checked += len(layer) * len(task.pre)
+        rows, acts, children = task.successors(task.pack(layer))
+        # first occurrence of every distinct child, in generation order
+        flat = np.ascontiguousarray(children).view(np.dtype((np.void, task.nbytes))).ravel()
+        first = np.sort(np.unique(flat, return_index=True)[1])
+        missing = task.goal_count(children[first])
+        next_layer = list()
+        for j, new_state, m in zip(first.tolist(), task.unpack(children[first]), missing.tolist()):
+            new_key = key(new_state)
+            if new_key in parents:
+                continue
+            parents[new_key] = (layer[rows[j]], int(acts[j]))
+            if m == 0:
+                stats.generated += j + 1
+                stats.duplicates += j - len(next_layer)
+                return extract_plan(parser, parents, new_state, key), parents
+            next_layer.append(new_state)
+        stats.generated += len(rows)
+        stats.duplicates += len(rows) - len(next_layer)
+        layer = next_layer
+        stats.peak_frontier = max(stats.peak_frontier, len(layer))
+    return None, parents